@@ -6,35 +6,88 @@ AI統合版 - 自然言語で期間・ユーザー指定可能
 
 import os
 import csv
+import asyncio
+import codecs
+import sqlite3
+import threading
 import io
 import json
 import re
-from datetime import datetime
+import time
+import traceback
+import hashlib
+import heapq
+import unicodedata
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import aclosing
+from functools import lru_cache, wraps
+from itertools import zip_longest
+from operator import itemgetter
 
 import discord
 from discord import app_commands
 import google.generativeai as genai
+from google.generativeai import caching
 
 
 # =============================================================================
 # 設定値
 # =============================================================================
 GUILD_ID = 1172020927047942154
-CHANNEL_IDS = [1448981729938247710]  # レベッター（❤️集計）
+CHANNEL_IDS: frozenset[int] = frozenset({1448981729938247710})  # レベッター（❤️集計）
 LUNCH_CHANNEL_ID = 1437763696096182363  # ランチ制度チャンネル
 LUNCH_THREAD_ID = 1459225398616260853  # ランチ制度フォーム投稿スレッド
 AI_THREAD_ID = 1451733100882165882  # 本気AI提出スレッド
 AI_CHANNEL_ID = 1425718558935224362  # 本気AI関連チャンネル
-ALLOWED_USER_IDS = [1340666940615823451, 1307922048731058247]
+ALLOWED_USER_IDS: frozenset[int] = frozenset({1340666940615823451, 1307922048731058247})
 HEART_EMOJI = "❤️"
 EXCLUDE_BOTS = True
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 
 # タイムゾーン
 JST = ZoneInfo("Asia/Tokyo")
 UTC = ZoneInfo("UTC")
 
+# AI意図解析キャッシュ
+INTENT_CACHE_SIZE = 512
+INTENT_CACHE_TTL = 3600  # 秒
+INTENT_CONTEXT_TTL = 3600  # Geminiコンテキストキャッシュの有効期限（秒）
+INTENT_CONTEXT_REFRESH_MARGIN = 300  # 期限のこの秒数前に作り直す
+
+# 全期間集計のスナップショット（インデックス未取り込み時のフォールバック用）
+ALL_SNAPSHOT_TTL = 300  # 秒
+
+# メッセージインデックス（SQLite）
+INDEX_DB_PATH = os.environ.get("INDEX_DB_PATH", "stats.db")
+INDEX_RESCAN_DAYS = 7  # 起動時に❤️・削除を取り直す直近日数（停止中の変更を拾う）
+# 1 にすると起動時に全履歴を読み直し、古い投稿の❤️・削除も含めてインデックスを突き合わせる
+INDEX_FULL_RESCAN = os.environ.get("INDEX_FULL_RESCAN") == "1"
+
+# スラッシュコマンド定義のハッシュ保存先（定義が変わったときだけ同期する。FORCE_SYNC=1 で常に同期）
+COMMAND_SYNC_HASH_PATH = os.environ.get("COMMAND_SYNC_HASH_PATH", ".commands_sync_hash")
+
+# ランチ制度の集計で、取得した投稿を何件ずつまとめて別スレッドでパースするか
+LUNCH_PARSE_BATCH = 50
+LUNCH_PARSE_QUEUE_SIZE = 4  # 取得済みでパース待ちのまとまりの上限
+
+# ギルドキャッシュにないチャンネル・スレッド（アーカイブ済みなど）を取得し直すまでの秒数
+CHANNEL_CACHE_TTL = 3600
+CHANNEL_MEMBER_COUNT_TTL = 300  # チャンネルメンバー数（Bot除く）を数え直すまでの秒数
+
+# チャンネル履歴を同時に読む最大数（レート制限に当たりにくくする）
+SCAN_CONCURRENCY = 4
+HISTORY_SLICES = 4  # 開始・終了のある期間の履歴を何分割して並行取得するか
+HISTORY_SLICE_BUFFER = 100  # 並行取得中の各区間が先読みしておくメッセージ数の上限（約1ページ分）
+
+# 本気AI提出の名前抽出（正規表現で取れなかった投稿をまとめてAIに問い合わせる）
+AI_NAME_BATCH_SIZE = 20  # 1回の問い合わせに含める投稿数
+AI_NAME_CONCURRENCY = 4  # 同時に投げる問い合わせ数
+AI_NAME_MAX_ATTEMPTS = 3  # AIエラーで名前を補えなかった投稿を何回まで問い合わせるか（初回を含む）
+# 取り込み時に先頭5件の抽出過程をログに出すか（AI_STATS_DEBUG=1 のときのみ）
+AI_STATS_DEBUG = os.environ.get("AI_STATS_DEBUG") == "1"
+
 
 # =============================================================================
 # AI クライアント初期化（Gemini）
@@ -44,17 +97,23 @@ def init_gemini():
     api_key = os.environ.get("GEMINI_API_KEY")
     if api_key:
         genai.configure(api_key=api_key)
-        return genai.GenerativeModel("gemini-2.5-flash")
+        return genai.GenerativeModel(GEMINI_MODEL)
     return None
 
 ai_model = None  # 起動時に初期化
 
 
+# ma-ji.ai や google.com/forms などのURL
+_URL_RE = re.compile(r'https?://[^\s<>\]\)」』】]+')
+# 名前: xxx または 名前：xxx
+_NAME_COLON_RE = re.compile(r'名前[:：]\s*\n?(.+?)(?:\n|$)')
+# 【名前\n(説明)】\n実際の名前
+_NAME_BRACKET_RE = re.compile(r'【名前[^】]*】\s*\n(.+?)(?:\n|$)')
+
+
 def extract_urls(content: str) -> set[str]:
     """メッセージからURLを抽出する"""
-    # ma-ji.ai や google.com/forms などのURLを抽出
-    url_pattern = r'https?://[^\s<>\]\)」』】]+'
-    urls = re.findall(url_pattern, content)
+    urls = _URL_RE.findall(content)
     # 正規化（末尾の句読点などを除去）
     normalized = set()
     for url in urls:
@@ -66,15 +125,19 @@ def extract_urls(content: str) -> set[str]:
 
 def extract_name_regex(content: str) -> str | None:
     """正規表現でメッセージから名前を抽出する（高速）"""
+    # どちらのパターンも「名前」を含むので、なければ正規表現を走らせない
+    if "名前" not in content:
+        return None
+
     # パターン1: 名前: xxx または 名前：xxx
-    match = re.search(r'名前[:：]\s*\n?(.+?)(?:\n|$)', content)
+    match = _NAME_COLON_RE.search(content)
     if match:
         name = match.group(1).strip()
         if 2 <= len(name) <= 20:
             return name
 
     # パターン2: 【名前\n(説明)】\n実際の名前
-    match = re.search(r'【名前[^】]*】\s*\n(.+?)(?:\n|$)', content)
+    match = _NAME_BRACKET_RE.search(content)
     if match:
         name = match.group(1).strip()
         if 2 <= len(name) <= 20:
@@ -83,39 +146,98 @@ def extract_name_regex(content: str) -> str | None:
     return None
 
 
-def extract_name_with_ai(content: str, debug: bool = False) -> str | None:
-    """AIを使ってメッセージから名前を抽出する（フォールバック）"""
-    if ai_model is None:
-        if debug:
-            print("DEBUG: ai_model is None", flush=True)
-        return None
-
+@lru_cache(maxsize=4096)
+def _ask_ai_name(snippet: str) -> str:
+    """
+    Gemini に名前を問い合わせて応答をそのまま返す。
+    同じ本文（編集・再集計）では問い合わせ直さない（例外はキャッシュされない）。
+    """
     prompt = f"""以下のメッセージから人の名前（フルネーム）を1つだけ抽出してください。
 名前のみを出力してください。余計な説明は不要です。
 名前が見つからない場合は「なし」と出力してください。
 
 メッセージ:
-{content[:500]}
+{snippet}
 
 名前:"""
+    response = ai_model.generate_content(prompt)
+    return response.text.strip()
+
+
+def extract_name_with_ai(content: str, debug: bool = False) -> str | None:
+    """AIを使ってメッセージから名前を抽出する（フォールバック）"""
+    if ai_model is None:
+        if debug:
+            print("DEBUG: ai_model is None", flush=True)
+        return None
 
     try:
-        response = ai_model.generate_content(prompt)
-        result = response.text.strip()
+        result = _ask_ai_name(content[:500])
 
         if debug:
             print(f"DEBUG AI: '{result}'", flush=True)
 
-        if result in ["なし", "なし。", "", "不明"]:
-            return None
-        if len(result) > 20:
-            return None
-        return result
+        return _clean_ai_name(result)
     except Exception as e:
         print(f"AI error: {e}", flush=True)
         return None
 
 
+# AIが使えない・エラーになったことを表す値（AIが「名前なし」と答えた None と区別する）
+AI_NAME_FAILED = object()
+
+
+def _extract_name_or_failed(content: str) -> str | object | None:
+    """1件ずつAIに問い合わせる。エラー時は None ではなく AI_NAME_FAILED を返す"""
+    try:
+        return _clean_ai_name(_ask_ai_name(content[:500]))
+    except Exception as e:
+        print(f"AI error: {e}", flush=True)
+        return AI_NAME_FAILED
+
+
+def _clean_ai_name(result: str) -> str | None:
+    """AIの応答を名前として採用できるか判定する"""
+    if result in ["なし", "なし。", "", "不明"]:
+        return None
+    if len(result) > 20:
+        return None
+    return result
+
+
+def extract_names_with_ai_batch(contents: list[str]) -> list[str | object | None]:
+    """
+    複数メッセージの名前を1回の問い合わせでまとめて抽出する。
+    応答が解釈できない場合は1件ずつの問い合わせに切り替える。
+    AIが使えない・エラーになったメッセージは AI_NAME_FAILED になる（名前なしは None）。
+    """
+    if ai_model is None:
+        return [AI_NAME_FAILED] * len(contents)
+    if len(contents) == 1:
+        return [_extract_name_or_failed(contents[0])]
+
+    numbered = "\n\n".join(f"[{i}]\n{content[:500]}" for i, content in enumerate(contents, 1))
+    prompt = f"""以下の{len(contents)}件のメッセージそれぞれから、人の名前（フルネーム）を1つだけ抽出してください。
+メッセージの番号順に、名前の文字列を並べたJSON配列（要素数{len(contents)}）のみを出力してください。余計な説明は不要です。
+名前が見つからないメッセージは「なし」としてください。
+
+{numbered}
+
+JSON配列:"""
+
+    try:
+        response = ai_model.generate_content(prompt)
+        json_text = find_json_span(response.text, "[", "]")
+        names = json.loads(json_text) if json_text else None
+        if not isinstance(names, list) or len(names) != len(contents):
+            raise ValueError("件数が一致しない応答")
+    except Exception as e:
+        print(f"AI batch error: {e}", flush=True)
+        return [_extract_name_or_failed(content) for content in contents]
+
+    return [_clean_ai_name(str(name).strip()) if name else None for name in names]
+
+
 def extract_name_hybrid(content: str, debug: bool = False) -> str | None:
     """ハイブリッド方式: まず正規表現、失敗時のみAI"""
     # まず正規表現で試す（高速）
@@ -142,36 +264,270 @@ client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 
+# =============================================================================
+# サーバーメンバー一覧キャッシュ
+# =============================================================================
+# /ask・メンション対応のたびに guild.members を走査しないよう、
+# Bot を除くメンバー一覧をギルドごとに保持し、メンバーイベントで破棄する。
+_members_cache: dict[int, list[dict]] = {}
+
+
+def get_members_cached(guild: discord.Guild) -> list[dict]:
+    """Bot を除くメンバー一覧 [{"id": int, "name": str}, ...] を返す"""
+    members = _members_cache.get(guild.id)
+    if members is None:
+        members = [{"id": m.id, "name": m.display_name} for m in guild.members if not m.bot]
+        # メンバー取得（chunk）が終わるまではキャッシュしない
+        if guild.chunked:
+            _members_cache[guild.id] = members
+    return members
+
+
+# メンバー一覧から作る派生文字列（意図キャッシュのキー・AIプロンプト用）。
+# キャッシュ済みの同じリストが渡される間は作り直さない。
+_members_derived = {
+    "source": None,   # 派生元のメンバーリスト（同一オブジェクトか判定する）
+    "ids_key": "",    # ソート済みメンバーIDの連結
+    "info": "",       # プロンプト用のメンバー一覧（先頭50人）
+    "match_names": []  # 定型クエリ判定用の正規化済みの名前（2文字以上のみ）
+}
+
+
+def get_members_derived(guild_members: list[dict]) -> dict:
+    """メンバーリストから意図キャッシュキー用ID列・プロンプト用一覧・照合用の名前を返す"""
+    global _members_derived
+    derived = _members_derived
+    if derived["source"] is not guild_members:
+        # 別スレッド（意図解析）からも呼ばれるので、作り終えてから丸ごと差し替える
+        names = (normalize_name(extract_name_from_nickname(m["name"])) for m in guild_members)
+        derived = {
+            "source": guild_members,
+            "ids_key": ",".join(str(i) for i in sorted(m["id"] for m in guild_members)),
+            "info": "\n".join(f"- ID: {m['id']}, 名前: {m['name']}" for m in guild_members[:50]),
+            "match_names": [name for name in names if len(name) >= 2]
+        }
+        _members_derived = derived
+    return derived
+
+
+def get_inactive_members(guild: discord.Guild, user_stats: dict) -> list[str]:
+    """集計結果に含まれないメンバー（Bot除く）の表示名一覧"""
+    return [m["name"] for m in get_members_cached(guild) if m["id"] not in user_stats]
+
+
+@client.event
+async def on_member_join(member: discord.Member):
+    _members_cache.pop(member.guild.id, None)
+
+
+@client.event
+async def on_member_remove(member: discord.Member):
+    _members_cache.pop(member.guild.id, None)
+
+
+@client.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    # ロール変更などでは作り直さない
+    if before.display_name != after.display_name:
+        _members_cache.pop(after.guild.id, None)
+
+
+@client.event
+async def on_user_update(before: discord.User, after: discord.User):
+    # グローバル表示名の変更はサーバーニックネーム未設定のメンバーに影響する
+    if before.display_name != after.display_name:
+        _members_cache.clear()
+
+
+# =============================================================================
+# チャンネル・スレッド取得キャッシュ
+# =============================================================================
+# アーカイブ済みスレッドなどギルドキャッシュにないものは fetch_channel が必要になるため、
+# 取得結果を一定時間使い回す。チャンネル・スレッドの更新/削除イベントで破棄する。
+_channel_cache: dict[int, tuple[float, discord.abc.GuildChannel | discord.Thread]] = {}
+
+
+async def get_or_fetch_channel(guild: discord.Guild, channel_id: int):
+    """ギルドキャッシュ → 取得済みキャッシュ → fetch_channel の順で引く（見つからなければ例外）"""
+    channel = guild.get_channel_or_thread(channel_id)
+    if channel is not None:
+        return channel
+    cached = _channel_cache.get(channel_id)
+    if cached is not None and time.monotonic() - cached[0] < CHANNEL_CACHE_TTL:
+        return cached[1]
+    channel = await client.fetch_channel(channel_id)
+    _channel_cache[channel_id] = (time.monotonic(), channel)
+    return channel
+
+
+# チャンネルID -> (数えたときのサーバー人数, 数えた時刻, Botを除くチャンネルメンバー数)
+# 参加・退出でサーバー人数が変われば数え直す。権限変更はチャンネル更新イベントと TTL で拾う。
+_channel_member_counts: dict[int, tuple[int | None, float, int]] = {}
+
+
+def count_channel_members(channel: discord.TextChannel) -> int:
+    """チャンネルを閲覧できるメンバー数（Bot除く）。一覧は作らずに数える"""
+    member_count = channel.guild.member_count
+    cached = _channel_member_counts.get(channel.id)
+    if (
+        cached is not None
+        and cached[0] == member_count
+        and time.monotonic() - cached[1] < CHANNEL_MEMBER_COUNT_TTL
+    ):
+        return cached[2]
+    count = sum(1 for m in channel.members if not m.bot)
+    _channel_member_counts[channel.id] = (member_count, time.monotonic(), count)
+    return count
+
+
+@client.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    _channel_cache.pop(after.id, None)
+    _channel_member_counts.pop(after.id, None)
+
+
+@client.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    _channel_cache.pop(channel.id, None)
+
+
+@client.event
+async def on_raw_thread_update(payload: discord.RawThreadUpdateEvent):
+    _channel_cache.pop(payload.thread_id, None)
+
+
+@client.event
+async def on_raw_thread_delete(payload: discord.RawThreadDeleteEvent):
+    _channel_cache.pop(payload.thread_id, None)
+
+
 # =============================================================================
 # AI 意図解析
 # =============================================================================
-def parse_intent_with_ai(user_input: str, current_date: str, guild_members: list[dict]) -> dict:
+# parse_intent_with_ai は別スレッドで呼ばれるので、キャッシュの読み書きはロックの中で行う
+_intent_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_intent_cache_date: str | None = None
+_intent_cache_lock = threading.Lock()
+
+
+def _intent_cache_key(user_input: str, current_date: str, guild_members: list[dict]) -> str:
+    """クエリ・日付・メンバー構成から意図キャッシュのキーを作る"""
+    # 全角/半角・大文字小文字・空白の揺れを吸収
+    query = unicodedata.normalize("NFKC", user_input)
+    query = "".join(query.split()).lower()
+    member_ids = get_members_derived(guild_members)["ids_key"]
+    raw = f"{query}\n{current_date}\n{member_ids}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# 定型クエリ判定用の正規表現
+_FAST_REPORT_RE = re.compile(r'レポート|集計|report', re.IGNORECASE)
+_FAST_KEYWORD_ONLY_RE = re.compile(r'^(?:全期間|all|先月|last|今月)$', re.IGNORECASE)
+_FAST_YEAR_MONTH_RE = re.compile(r'(\d{4})\s*[年\-/]\s*(\d{1,2})(?!\d)')
+_FAST_MONTH_RE = re.compile(r'(?<![\d年\-/])(\d{1,2})月')
+_FAST_ALL_RE = re.compile(r'全期間|\ball\b', re.IGNORECASE)
+_FAST_LAST_RE = re.compile(r'先月|\blast\b', re.IGNORECASE)
+_FAST_THIS_RE = re.compile(r'今月')
+# 日単位・時刻・範囲指定、相対年・年度指定、ユーザー指定、いいね照会はAIに任せる
+_FAST_REJECT_RE = re.compile(
+    r'[〜~]|\d+日|\d{1,2}/\d{1,2}(?!\d)|\d{4}\s*[年\-/]\s*\d{1,2}\s*[\-/]\s*\d|\d+:\d+'
+    r'|去年|昨年|前年|来年|年度|いいね|ハート|like|さん|くん|君|ちゃん|様|@',
+    re.IGNORECASE
+)
+
+
+def parse_intent_fast(user_input: str, current_date: str, guild_members: list[dict]) -> dict | None:
     """
-    AIを使ってユーザー入力から意図を解析する。
+    「先月のレポート」「2024-01 の集計」「all」のような定型クエリを
+    AIを使わずに解析する。確実に判断できない場合は None を返す。
+    """
+    text = unicodedata.normalize("NFKC", user_input).strip()
+    if not text or _FAST_REJECT_RE.search(text):
+        return None
+    if not (_FAST_REPORT_RE.search(text) or _FAST_KEYWORD_ONLY_RE.match(text)):
+        return None
 
-    Args:
-        user_input: ユーザーの自然言語入力
-        current_date: 現在日付（YYYY-MM-DD形式）
-        guild_members: サーバーメンバーリスト [{"id": int, "name": str}, ...]
+    # メンバー名が含まれていればユーザー指定の可能性があるのでAIへ
+    compact = normalize_name(text)
+    for name in get_members_derived(guild_members)["match_names"]:
+        if name in compact:
+            return None
 
-    Returns:
-        {
-            "action": "report" | "user_likes" | "unknown",
-            "period": {"year": int, "month": int} | "last" | "all" | null,
-            "target_user_id": int | null,
-            "error": str | null
-        }
+    periods = []
+    for year, month in _FAST_YEAR_MONTH_RE.findall(text):
+        periods.append({"year": int(year), "month": int(month)})
+    # 年付きの月を除いた残りから年なしの「N月」を探す（混在すれば複数期間として不採用）
+    current_year, current_month = int(current_date[:4]), int(current_date[5:7])
+    for month in _FAST_MONTH_RE.findall(_FAST_YEAR_MONTH_RE.sub(" ", text)):
+        month = int(month)
+        # 今月より先の月は直近の過去（前年）の月とみなす（INTENT_SYSTEM_PROMPT の指示と同じ規則）
+        year = current_year - 1 if month > current_month else current_year
+        periods.append({"year": year, "month": month})
+    if _FAST_ALL_RE.search(text):
+        periods.append("all")
+    if _FAST_LAST_RE.search(text):
+        periods.append("last")
+    if _FAST_THIS_RE.search(text):
+        periods.append(None)
+
+    # 期間がちょうど1つに決まる場合のみ採用
+    if len(periods) != 1:
+        return None
+    period = periods[0]
+    if isinstance(period, dict) and not 1 <= period["month"] <= 12:
+        return None
+
+    return {"action": "report", "period": period, "target_user_id": None, "error": None}
+
+
+def parse_intent_with_ai(user_input: str, current_date: str, guild_members: list[dict]) -> dict:
     """
-    members_info = "\n".join([f"- ID: {m['id']}, 名前: {m['name']}" for m in guild_members[:50]])
+    ユーザー入力から意図を解析する（キャッシュ付き）。
 
-    prompt = f"""あなたはDiscord Botのコマンド解析アシスタントです。
-ユーザーの入力から、以下の情報を抽出してJSON形式で返してください。
+    定型クエリは parse_intent_fast で即座に解決し、それ以外は
+    同じ日付・同じメンバー構成での同一クエリであれば、TTL内は AIを呼ばずに
+    前回の解析結果を返す。引数・戻り値は _request_intent_from_ai と同じ。
+    AI呼び出しでブロックするので、イベントループからは asyncio.to_thread で呼ぶ。
+    """
+    global _intent_cache_date
+
+    intent = parse_intent_fast(user_input, current_date, guild_members)
+    if intent is not None:
+        return intent
+
+    key = _intent_cache_key(user_input, current_date, guild_members)
+    now = time.monotonic()
+
+    with _intent_cache_lock:
+        # 日付が変わったら「先月」「今月」の意味が変わるので全破棄
+        if _intent_cache_date != current_date:
+            _intent_cache.clear()
+            _intent_cache_date = current_date
 
-## 現在日付
-{current_date}
+        cached = _intent_cache.get(key)
+        if cached is not None:
+            cached_at, intent = cached
+            if now - cached_at < INTENT_CACHE_TTL:
+                _intent_cache.move_to_end(key)
+                return dict(intent)
+            del _intent_cache[key]
 
-## サーバーメンバー一覧
-{members_info}
+    intent = _request_intent_from_ai(user_input, current_date, guild_members)
+
+    # 解析に失敗した結果はキャッシュしない（一時的なAPIエラー等）
+    if not intent.get("error") and intent.get("action") != "unknown":
+        with _intent_cache_lock:
+            _intent_cache[key] = (now, dict(intent))
+            if len(_intent_cache) > INTENT_CACHE_SIZE:
+                _intent_cache.popitem(last=False)
+
+    return intent
+
+
+# 静的な指示部分（Geminiのコンテキストキャッシュに載せる）
+INTENT_SYSTEM_PROMPT = """あなたはDiscord Botのコマンド解析アシスタントです。
+ユーザーの入力から、以下の情報を抽出してJSON形式で返してください。
+現在日付とサーバーメンバー一覧は別途与えられます。
 
 ## 抽出する情報
 
@@ -181,13 +537,14 @@ def parse_intent_with_ai(user_input: str, current_date: str, guild_members: list
    - "unknown": 判断できない
 
 2. period: 集計期間
-   - {{"year": 2024, "month": 1}} のような形式（月単位）
-   - {{"start": "2024-01-15 09:00", "end": "2024-01-15 23:59"}} のような形式（日時範囲指定）
+   - {"year": 2024, "month": 1} のような形式（月単位）
+   - {"start": "2024-01-15 09:00", "end": "2024-01-15 23:59"} のような形式（日時範囲指定）
    - "last": 先月
    - "all": 全期間
    - null: 指定なし（デフォルトで今月扱い）
    ※日付や時刻の範囲指定がある場合は必ず start/end 形式を使ってください。
-   ※年の指定がない場合は現在日付の年を使ってください。
+   ※年の指定がない場合は現在日付の年を使ってください。ただし現在の月より後の月は前年とします
+     （例: 現在日付が2026-01-10なら「12月」は {"year": 2025, "month": 12}）。
    ※時刻の指定がない場合は、startは 00:00、endは 23:59 をデフォルトとしてください。
 
 3. target_user_id: 対象ユーザーのID（user_likes の場合のみ）
@@ -199,62 +556,246 @@ def parse_intent_with_ai(user_input: str, current_date: str, guild_members: list
 ## 入力例と出力例
 
 入力: "先月のレポート"
-出力: {{"action": "report", "period": "last", "target_user_id": null, "error": null}}
+出力: {"action": "report", "period": "last", "target_user_id": null, "error": null}
 
 入力: "田中さんのいいね数"
-出力: {{"action": "user_likes", "period": null, "target_user_id": 123456789, "error": null}}
+出力: {"action": "user_likes", "period": null, "target_user_id": 123456789, "error": null}
 
 入力: "2024年1月の集計"
-出力: {{"action": "report", "period": {{"year": 2024, "month": 1}}, "target_user_id": null, "error": null}}
+出力: {"action": "report", "period": {"year": 2024, "month": 1}, "target_user_id": null, "error": null}
 
 入力: "1月の佐藤くんのハート数"
-出力: {{"action": "user_likes", "period": {{"year": 2024, "month": 1}}, "target_user_id": 987654321, "error": null}}
+出力: {"action": "user_likes", "period": {"year": 2024, "month": 1}, "target_user_id": 987654321, "error": null}
 
 入力: "2/15 11:16〜23:59のいいね数"
-出力: {{"action": "report", "period": {{"start": "2025-02-15 11:16", "end": "2025-02-15 23:59"}}, "target_user_id": null, "error": null}}
+出力: {"action": "report", "period": {"start": "2025-02-15 11:16", "end": "2025-02-15 23:59"}, "target_user_id": null, "error": null}
 
 入力: "1/10〜1/20のレポート"
-出力: {{"action": "report", "period": {{"start": "2025-01-10 00:00", "end": "2025-01-20 23:59"}}, "target_user_id": null, "error": null}}
-
-## ユーザー入力
-{user_input}
+出力: {"action": "report", "period": {"start": "2025-01-10 00:00", "end": "2025-01-20 23:59"}, "target_user_id": null, "error": null}
 
-## 出力
+## 出力形式
 JSONのみを出力してください。説明は不要です。
 """
 
+# キャッシュを使えない場合のプロンプト先頭部分と、毎回の問い合わせの固定部分
+_FULL_PROMPT_PREFIX = INTENT_SYSTEM_PROMPT + "\n## サーバーメンバー一覧\n"
+_QUERY_DATE_HEADER = "## 現在日付\n"
+_QUERY_INPUT_HEADER = "\n\n## ユーザー入力\n"
+_QUERY_OUTPUT_HEADER = "\n\n## 出力\n"
+
+# コンテキストキャッシュの状態（メンバー一覧が変わるか期限が近づいたら作り直す）
+_intent_context = {
+    "members_key": None,   # キャッシュ作成時のメンバー一覧
+    "model": None,         # from_cached_content で作ったモデル（失敗時は None）
+    "cache": None,         # CachedContent
+    "expires_at": 0.0      # time.monotonic() 基準の期限
+}
+# 複数スレッドから同時に作り直さないように（作り直しの API 呼び出し中も保持する）
+_intent_context_lock = threading.Lock()
+
+
+def _get_intent_model(members_info: str):
+    """
+    静的プロンプト＋メンバー一覧をコンテキストキャッシュに載せたモデルを返す。
+    キャッシュを作れない場合（トークン数不足・API エラー等）は None。
+    """
+    with _intent_context_lock:
+        now = time.monotonic()
+        ctx = _intent_context
+        if ctx["members_key"] == members_info and now < ctx["expires_at"] - INTENT_CONTEXT_REFRESH_MARGIN:
+            return ctx["model"]
+
+        # 古いキャッシュは削除して作り直す
+        if ctx["cache"] is not None:
+            try:
+                ctx["cache"].delete()
+            except Exception as e:
+                print(f"Context cache delete error: {e}", flush=True)
+
+        ctx["members_key"] = members_info
+        ctx["cache"] = None
+        ctx["model"] = None
+        try:
+            cache = caching.CachedContent.create(
+                model=f"models/{GEMINI_MODEL}",
+                display_name="likecounter-intent",
+                system_instruction=INTENT_SYSTEM_PROMPT,
+                contents=[f"## サーバーメンバー一覧\n{members_info}"],
+                ttl=timedelta(seconds=INTENT_CONTEXT_TTL)
+            )
+            ctx["cache"] = cache
+            ctx["model"] = genai.GenerativeModel.from_cached_content(cached_content=cache)
+            ctx["expires_at"] = now + INTENT_CONTEXT_TTL
+        except Exception as e:
+            # 失敗時もTTLの間は再作成を試みない（毎回APIを叩かないため）
+            print(f"Context cache unavailable, using full prompt: {e}", flush=True)
+            ctx["expires_at"] = now + INTENT_CONTEXT_TTL
+
+        return ctx["model"]
+
+
+def find_json_span(text: str, open_ch: str = "{", close_ch: str = "}") -> str | None:
+    """
+    テキスト中の最初のJSONオブジェクト部分を括弧の対応を数えて切り出す。
+    文字列リテラル内の括弧やエスケープは無視する（配列なら open_ch="[", close_ch="]"）。
+    """
+    start = text.find(open_ch)
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == open_ch:
+            depth += 1
+        elif ch == close_ch:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _request_intent_from_ai(user_input: str, current_date: str, guild_members: list[dict]) -> dict:
+    """
+    AIを使ってユーザー入力から意図を解析する。
+
+    Args:
+        user_input: ユーザーの自然言語入力
+        current_date: 現在日付（YYYY-MM-DD形式）
+        guild_members: サーバーメンバーリスト [{"id": int, "name": str}, ...]
+
+    Returns:
+        {
+            "action": "report" | "user_likes" | "unknown",
+            "period": {"year": int, "month": int} | "last" | "all" | null,
+            "target_user_id": int | null,
+            "error": str | null
+        }
+    """
+    members_info = get_members_derived(guild_members)["info"]
+
+    # 毎回変わるのは日付とユーザー入力だけ（固定部分は定数を連結する）
+    query_prompt = "".join((_QUERY_DATE_HEADER, current_date, _QUERY_INPUT_HEADER, user_input, _QUERY_OUTPUT_HEADER))
+
     try:
         if ai_model is None:
             return {"action": "unknown", "period": None, "target_user_id": None, "error": "AI未初期化"}
 
-        response = ai_model.generate_content(prompt)
+        cached_model = _get_intent_model(members_info)
+        if cached_model is not None:
+            response = cached_model.generate_content(query_prompt)
+        else:
+            prompt = "".join((_FULL_PROMPT_PREFIX, members_info, "\n\n", query_prompt))
+            response = ai_model.generate_content(prompt)
         result_text = response.text.strip()
 
         # JSON部分を抽出
-        json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
+        json_text = find_json_span(result_text)
+        if json_text is None:
             return {"action": "unknown", "period": None, "target_user_id": None, "error": "JSON解析失敗"}
+        try:
+            return json.loads(json_text)
+        except json.JSONDecodeError:
+            # 文字列中の改行など制御文字を許容して再試行
+            return json.loads(json_text, strict=False)
 
     except Exception as e:
         return {"action": "unknown", "period": None, "target_user_id": None, "error": str(e)}
 
 
+# =============================================================================
+# 並行実行ユーティリティ
+# =============================================================================
+async def gather_limited(*coros, limit: int = SCAN_CONCURRENCY, return_exceptions: bool = False) -> list:
+    """asyncio.gather と同じだが、同時に実行するのは limit 個まで"""
+    sem = asyncio.Semaphore(limit)
+
+    async def bounded(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(bounded(c) for c in coros), return_exceptions=return_exceptions)
+
+
+async def iter_history(
+    channel: discord.abc.Messageable,
+    start_utc: datetime | None,
+    end_utc: datetime | None,
+    slices: int = HISTORY_SLICES
+):
+    """
+    channel.history(after=start_utc, before=end_utc, oldest_first=True) と同じ順でメッセージを返す。
+    開始・終了の両方がある場合は期間をスノーフレークで等分し、各区間を並行して取得する
+    （1回100件ずつのページ取得の待ち時間を重ねる）。先頭の区間から順に返す。
+    各区間の先読みは HISTORY_SLICE_BUFFER 件までなので、期間全体をメモリに溜め込まない。
+    """
+    if start_utc is None or end_utc is None or slices <= 1:
+        async for message in channel.history(after=start_utc, before=end_utc, limit=None, oldest_first=True):
+            yield message
+        return
+
+    step = (end_utc - start_utc) / slices
+    # 区間の境界のID（各区間は境界ID以上・次の境界ID未満。両端は元の日時指定のまま）
+    bounds = [discord.utils.time_snowflake(start_utc + step * i) for i in range(1, slices)]
+    afters = [start_utc] + [discord.Object(id=b - 1) for b in bounds]
+    befores = [discord.Object(id=b) for b in bounds] + [end_utc]
+
+    async def produce(after, before, queue: asyncio.Queue) -> None:
+        # 取得したメッセージを順に積み、終わりに None（失敗時は例外）を積む
+        try:
+            async for message in channel.history(after=after, before=before, limit=None, oldest_first=True):
+                await queue.put(message)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    queues = [asyncio.Queue(maxsize=HISTORY_SLICE_BUFFER) for _ in afters]
+    tasks = [asyncio.create_task(produce(a, b, q)) for a, b, q in zip(afters, befores, queues)]
+    try:
+        for queue in queues:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 # =============================================================================
 # 期間計算ユーティリティ
 # =============================================================================
-def get_period_range(period) -> tuple[datetime | None, datetime | None]:
+# /report の期間指定（YYYY-MM / YYYY/MM / all）
+_YM_RE = re.compile(r'(\d{4})[-/](\d{1,2})')
+_ALL_RE = re.compile(r'^(all|全期間)$', re.I)
+
+
+def get_period_range(period, now_jst: datetime | None = None) -> tuple[datetime | None, datetime | None]:
     """
     期間指定から開始日時と終了日時（JST）を返す。
 
     Args:
         period: {"year": int, "month": int} | "last" | "all" | None
+        now_jst: 基準となる現在時刻（省略時は datetime.now(JST)）
 
     Returns:
         (start_dt, end_dt) - JST での期間
     """
-    now_jst = datetime.now(JST)
+    if now_jst is None:
+        now_jst = datetime.now(JST)
 
     if period is None:
         # 今月
@@ -294,18 +835,27 @@ def get_period_range(period) -> tuple[datetime | None, datetime | None]:
         return start_dt, end_dt
 
     # デフォルト: 今月
-    return get_period_range(None)
+    return get_period_range(None, now_jst)
 
 
-def format_period_str(period) -> str:
+def is_empty_window(start_utc: datetime | None, end_utc: datetime | None) -> bool:
+    """取得範囲に投稿がありえない（開始が未来、または開始 >= 終了）なら True"""
+    if start_utc is None:
+        return False
+    if end_utc is not None and start_utc >= end_utc:
+        return True
+    return start_utc >= datetime.now(UTC)
+
+
+def format_period_str(period, now_jst: datetime | None = None) -> str:
     """期間を表示用文字列に変換"""
+    if period is None or period == "last":
+        now = now_jst or datetime.now(JST)
     if period is None:
-        now = datetime.now(JST)
         return f"{now.year}年{now.month}月"
     if period == "all":
         return "全期間"
     if period == "last":
-        now = datetime.now(JST)
         if now.month == 1:
             return f"{now.year - 1}年12月"
         return f"{now.year}年{now.month - 1}月"
@@ -316,9 +866,359 @@ def format_period_str(period) -> str:
     return str(period)
 
 
+# =============================================================================
+# メッセージインデックス（SQLite）
+# =============================================================================
+# 集計対象チャンネルの投稿と❤️リアクションをローカルに保持し、
+# 集計のたびに Discord の履歴を読み直さずに済むようにする。
+# 起動時に前回の続きから履歴を取り込み、以降はイベントで差分更新する。
+# 接続は起動時（main）に open_index_db で開く（import しただけではファイルを作らない）。
+_INDEX_SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS msgs (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    author_name TEXT NOT NULL,
+    is_bot INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    hearts INTEGER NOT NULL DEFAULT 0,
+    content TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS msgs_channel_ts ON msgs (channel_id, ts);
+CREATE INDEX IF NOT EXISTS msgs_author_ts ON msgs (author_id, ts);
+CREATE TABLE IF NOT EXISTS heart_users (
+    message_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    user_name TEXT NOT NULL,
+    is_bot INTEGER NOT NULL,
+    PRIMARY KEY (message_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    channel_id INTEGER PRIMARY KEY,
+    last_message_id INTEGER NOT NULL
+);
+"""
+index_db: sqlite3.Connection | None = None
+
+# 起動後に取り込みが完了したチャンネル（未完了の間は Discord から直接集計）
+_index_ready: set[int] = set()
+_index_sync_task: asyncio.Task | None = None
+
+
+def open_index_db(path: str = INDEX_DB_PATH) -> sqlite3.Connection:
+    """インデックスDBを開き、テーブルがなければ作る（本気AIの提出キャッシュも同じDB）"""
+    db = sqlite3.connect(path)
+    db.executescript(_INDEX_SCHEMA)
+    db.executescript(_AI_POSTS_SCHEMA)
+    _migrate_ai_posts(db)
+    return db
+
+
+def _to_ms(dt: datetime) -> int:
+    """datetime を UTC エポックミリ秒に変換"""
+    return int(dt.timestamp() * 1000)
+
+
+def find_heart_reaction(message: discord.Message) -> discord.Reaction | None:
+    """
+    メッセージの❤️リアクションを返す（なければ None）。
+    Unicode絵文字の reaction.emoji は str なので str() 変換せずに比較する。
+    """
+    if not message.reactions:
+        return None
+    for reaction in message.reactions:
+        if reaction.emoji == HEART_EMOJI:
+            return reaction
+    return None
+
+
+def index_message(message: discord.Message, reactors: list | None = None) -> None:
+    """
+    メッセージをインデックスに書き込む（コミットは呼び出し側）。
+
+    Args:
+        message: 対象メッセージ
+        reactors: ❤️を付けたユーザー一覧。None の場合は既存のいいね記録を変更しない
+    """
+    reaction = find_heart_reaction(message)
+    hearts = reaction.count if reaction else 0
+
+    index_db.execute(
+        "INSERT OR REPLACE INTO msgs (id, channel_id, author_id, author_name, is_bot, ts, hearts, content) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            message.id, message.channel.id, message.author.id, message.author.display_name,
+            int(message.author.bot), _to_ms(message.created_at), hearts, message.content
+        )
+    )
+    if reactors is not None:
+        index_db.execute("DELETE FROM heart_users WHERE message_id = ?", (message.id,))
+        index_db.executemany(
+            "INSERT OR REPLACE INTO heart_users (message_id, user_id, user_name, is_bot) VALUES (?, ?, ?, ?)",
+            [(message.id, u.id, u.display_name, int(u.bot)) for u in reactors]
+        )
+
+
+async def _sync_channel_index(channel: discord.TextChannel) -> None:
+    """
+    前回の取り込み位置以降の履歴をインデックスに取り込む。
+    Bot 停止中のリアクション変更・削除はイベントで拾えないため、
+    直近 INDEX_RESCAN_DAYS 日分は取り込み済みでも読み直す
+    （INDEX_FULL_RESCAN=1 なら全履歴を読み直して突き合わせる）。
+    """
+    row = index_db.execute(
+        "SELECT last_message_id FROM sync_state WHERE channel_id = ?", (channel.id,)
+    ).fetchone()
+    now_utc = datetime.now(UTC)
+    # 取り込み中に投稿されたメッセージを「削除済み」と誤判定しないための上限
+    sync_started_id = discord.utils.time_snowflake(now_utc, high=True)
+    after = None
+    if row and not INDEX_FULL_RESCAN:
+        rescan_from = discord.utils.time_snowflake(now_utc - timedelta(days=INDEX_RESCAN_DAYS))
+        after = discord.Object(id=min(row[0], rescan_from))
+
+    seen_ids = set()
+    count = 0
+    async for message in channel.history(after=after, limit=None, oldest_first=True):
+        seen_ids.add(message.id)
+        reaction = find_heart_reaction(message)
+        reactors = [u async for u in reaction.users()] if reaction else []
+        index_message(message, reactors)
+        index_db.execute(
+            "INSERT OR REPLACE INTO sync_state (channel_id, last_message_id) VALUES (?, ?)",
+            (channel.id, message.id)
+        )
+        count += 1
+        if count % 100 == 0:
+            index_db.commit()
+            print(f"[index] channel {channel.id}: {count} messages synced...", flush=True)
+
+    # 読み直した範囲で見つからなかったメッセージは停止中に削除されたもの
+    if row:
+        stale = [
+            (msg_id,) for (msg_id,) in index_db.execute(
+                "SELECT id FROM msgs WHERE channel_id = ? AND id > ? AND id <= ?",
+                (channel.id, after.id if after else 0, sync_started_id)
+            )
+            if msg_id not in seen_ids
+        ]
+        index_db.executemany("DELETE FROM msgs WHERE id = ?", stale)
+        index_db.executemany("DELETE FROM heart_users WHERE message_id = ?", stale)
+    index_db.commit()
+    print(f"[index] channel {channel.id}: synced {count} messages", flush=True)
+
+
+async def sync_message_index(guild: discord.Guild) -> None:
+    """集計対象チャンネルのインデックスを最新化する（起動時に実行）"""
+    async def sync_one(channel_id: int) -> None:
+        channel = guild.get_channel(channel_id)
+        if not channel or not isinstance(channel, discord.TextChannel):
+            return
+        try:
+            await _sync_channel_index(channel)
+            _index_ready.add(channel_id)
+        except discord.HTTPException as e:
+            index_db.commit()
+            print(f"[index] channel {channel_id} sync failed: {e}", flush=True)
+
+    await gather_limited(*(sync_one(channel_id) for channel_id in CHANNEL_IDS))
+
+
+def _collect_stats_from_index(
+    guild: discord.Guild,
+    start_utc: datetime | None,
+    end_utc: datetime | None,
+    target_user_id: int | None,
+    collect_top_posts: bool
+) -> dict:
+    """collect_stats と同じ形式の結果をインデックスから集計する"""
+    # Discord の after/before と同じく両端を含まない
+    where = [f"m.channel_id IN ({','.join('?' * len(CHANNEL_IDS))})"]
+    params: list = list(CHANNEL_IDS)
+    if EXCLUDE_BOTS:
+        where.append("m.is_bot = 0")
+    if start_utc:
+        where.append("m.ts > ?")
+        params.append(_to_ms(start_utc))
+    if end_utc:
+        where.append("m.ts < ?")
+        params.append(_to_ms(end_utc))
+    where_sql = " AND ".join(where)
+
+    def display_name(user_id: int, stored_name: str) -> str:
+        member = guild.get_member(user_id)
+        return member.display_name if member else stored_name
+
+    user_stats = {}
+    msg_count = 0
+    rows = index_db.execute(
+        f"SELECT m.author_id, MAX(m.author_name), COUNT(*), SUM(m.hearts) FROM msgs m "
+        f"WHERE {where_sql} GROUP BY m.author_id",
+        params
+    )
+    for user_id, name, posts, hearts in rows:
+        msg_count += posts
+        # 特定ユーザーのみの場合、他人の投稿は投稿数・もらったいいねに数えない
+        # （いいねした回数は他人の投稿へのいいねも含めて数える）
+        if target_user_id and user_id != target_user_id:
+            posts = hearts = 0
+        user_stats[user_id] = {
+            "name": display_name(user_id, name),
+            "hearts": hearts,
+            "posts": posts,
+            "likes_given": 0
+        }
+
+    # いいねした回数（Botのリアクションは除外）
+    rows = index_db.execute(
+        f"SELECT h.user_id, MAX(h.user_name), COUNT(*) FROM heart_users h "
+        f"JOIN msgs m ON m.id = h.message_id WHERE {where_sql} AND h.is_bot = 0 GROUP BY h.user_id",
+        params
+    )
+    for user_id, name, count in rows:
+        if user_id not in user_stats:
+            user_stats[user_id] = {
+                "name": display_name(user_id, name),
+                "hearts": 0,
+                "posts": 0,
+                "likes_given": 0
+            }
+        user_stats[user_id]["likes_given"] = count
+
+    top_posts = []
+    if collect_top_posts:
+        rows = index_db.execute(
+            f"SELECT m.author_id, m.author_name, m.hearts, m.content, m.ts FROM msgs m "
+            f"WHERE {where_sql} AND m.hearts > 0 ORDER BY m.hearts DESC, m.id ASC LIMIT 10",
+            params
+        )
+        for user_id, name, hearts, content, ts in rows:
+            post_date = datetime.fromtimestamp(ts / 1000, tz=JST).strftime("%Y-%m-%d %H:%M")
+            top_posts.append({
+                "author": display_name(user_id, name),
+                "hearts": hearts,
+                "content": content,
+                "date": post_date
+            })
+
+    print(f"[collect_stats] Done from index: {msg_count} messages", flush=True)
+    return {"user_stats": user_stats, "top_posts": top_posts}
+
+
 # =============================================================================
 # 集計処理
 # =============================================================================
+async def _scan_channel_stats(
+    channel: discord.TextChannel,
+    start_utc: datetime | None,
+    end_utc: datetime | None,
+    target_user_id: int | None,
+    collect_top_posts: bool
+) -> dict:
+    """
+    1チャンネル分の履歴を読んで集計する（collect_stats から並行実行される）。
+
+    Returns:
+        {"user_stats": dict, "likes_given": dict, "top_posts": list, "msg_count": int, "reaction_count": int}
+    """
+    # user_id -> [名前, いいね数, 投稿数]（辞書より軽いリストで集計し、最後に辞書化する）
+    entries = defaultdict(lambda: ["", 0, 0])
+    likes_given = Counter()  # いいねした回数を追跡
+    reactor_names = {}  # いいねした人の表示名
+    top_posts = []  # いいね数トップ投稿
+    msg_count = 0
+    reaction_count = 0
+
+    print(f"[collect_stats] Processing channel {channel.id}...", flush=True)
+
+    # discord.py は100件未満のページを受け取った時点で取得を打ち切るため、
+    # 末尾の空ページ取得は発生しない（limit=None のまま自動ページングで良い）
+    async for message in iter_history(channel, start_utc, end_utc):
+        msg_count += 1
+        if msg_count % 50 == 0:
+            print(f"[collect_stats] #{channel.id}: {msg_count} messages, {reaction_count} reactions...", flush=True)
+
+        author = message.author
+
+        # Bot除外
+        if EXCLUDE_BOTS and author.bot:
+            continue
+
+        entry = entries[author.id]
+        if not entry[0]:
+            entry[0] = author.display_name
+
+        # 特定ユーザーのみの場合、他人の投稿は投稿数・もらったいいねに数えない
+        # （対象ユーザーが他人の投稿にしたいいねを数えるため、リアクションは読む）
+        is_target = not target_user_id or author.id == target_user_id
+
+        # 投稿数カウント
+        if is_target:
+            entry[2] += 1
+
+        # ❤️リアクションをカウント（リアクションのない投稿はここで終わり）
+        msg_hearts = 0
+        reaction = find_heart_reaction(message)
+        if reaction is not None:
+            msg_hearts = reaction.count
+            # 投稿者がもらったいいね数
+            if is_target:
+                entry[1] += msg_hearts
+
+            # いいねした人を取得（まとめて受け取ってから一括で数える）
+            reaction_count += 1
+            try:
+                reactors = [reactor async for reactor in reaction.users() if not reactor.bot]
+            except discord.Forbidden:
+                reactors = []  # リアクションユーザー取得権限がない場合はスキップ
+            likes_given.update(reactor.id for reactor in reactors)
+            for reactor in reactors:
+                reactor_names.setdefault(reactor.id, reactor.display_name)
+
+        # トップ投稿を収集
+        if collect_top_posts and msg_hearts > 0:
+            post_date = message.created_at.astimezone(JST).strftime("%Y-%m-%d %H:%M")
+            top_posts.append({
+                "author": entry[0],
+                "hearts": msg_hearts,
+                "content": message.content,
+                "date": post_date
+            })
+
+    # ドキュメント通りの辞書形式に変換（ユーザー数分だけ）
+    user_stats = {
+        uid: {"name": name, "hearts": hearts, "posts": posts, "likes_given": 0}
+        for uid, (name, hearts, posts) in entries.items()
+    }
+    for uid, name in reactor_names.items():
+        if uid not in user_stats:
+            user_stats[uid] = {"name": name, "hearts": 0, "posts": 0, "likes_given": 0}
+
+    return {
+        "user_stats": user_stats,
+        "likes_given": likes_given,
+        # 全体のトップ10に入りうるのは各チャンネルのトップ10だけ（同数は投稿順のまま）
+        "top_posts": heapq.nlargest(10, top_posts, key=itemgetter("hearts")),
+        "msg_count": msg_count,
+        "reaction_count": reaction_count
+    }
+
+
+# 全期間・全ユーザーの集計結果
+# (チャンネルID, collect_top_posts) -> (作成時刻, 各チャンネルの最新メッセージID, 結果)
+_all_snapshot: dict[tuple, tuple[float, tuple, dict]] = {}
+
+
+def _copy_stats_result(result: dict) -> dict:
+    """スナップショットを呼び出し側で書き換えられないよう複製する"""
+    return {
+        "user_stats": {uid: dict(stats) for uid, stats in result["user_stats"].items()},
+        "top_posts": list(result["top_posts"])
+    }
+
+
 async def collect_stats(
     guild: discord.Guild,
     start_utc: datetime | None,
@@ -331,8 +1231,8 @@ async def collect_stats(
 
     Args:
         guild: Discordサーバー
-        start_utc: 開始日時（UTC）
-        end_utc: 終了日時（UTC）
+        start_utc: 開始日時（タイムゾーン付き。UTC 以外でも可）
+        end_utc: 終了日時（タイムゾーン付き）
         target_user_id: 特定ユーザーのみ集計する場合はそのID
         collect_top_posts: いいね数トップ投稿を収集するか
 
@@ -342,189 +1242,270 @@ async def collect_stats(
             "top_posts": [{"author": str, "hearts": int, "content": str, "date": str}, ...]  # collect_top_posts=True時のみ
         }
     """
-    user_stats = {}
-    likes_given = defaultdict(int)  # いいねした回数を追跡
-    top_posts = []  # いいね数トップ投稿
-    msg_count = 0
-    reaction_count = 0
+    # 未来の期間などは履歴を読むまでもなく空
+    if is_empty_window(start_utc, end_utc):
+        return {"user_stats": {}, "top_posts": []}
 
+    # インデックスの取り込みが済んでいれば Discord API を使わずに集計
+    if all(channel_id in _index_ready for channel_id in CHANNEL_IDS):
+        return _collect_stats_from_index(guild, start_utc, end_utc, target_user_id, collect_top_posts)
+
+    channels = []
     for channel_id in CHANNEL_IDS:
         channel = guild.get_channel(channel_id)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            continue
-
-        print(f"[collect_stats] Processing channel {channel_id}...", flush=True)
+        if channel and isinstance(channel, discord.TextChannel):
+            channels.append(channel)
+
+    # 全期間の全体集計は、新着がなく TTL 内なら前回の結果を返す
+    # （last_message_id はゲートウェイイベントで更新されるので API 呼び出し不要）
+    snapshot_key = None
+    if start_utc is None and end_utc is None and not target_user_id:
+        snapshot_key = (tuple(sorted(ch.id for ch in channels)), collect_top_posts)
+        latest_ids = tuple(ch.last_message_id for ch in sorted(channels, key=lambda c: c.id))
+        cached = _all_snapshot.get(snapshot_key)
+        if cached is not None:
+            cached_at, cached_ids, cached_result = cached
+            if time.monotonic() - cached_at < ALL_SNAPSHOT_TTL and cached_ids == latest_ids:
+                print("[collect_stats] Using all-period snapshot", flush=True)
+                return _copy_stats_result(cached_result)
+
+    # チャンネルごとの履歴取得を並行実行（同時実行数は SCAN_CONCURRENCY まで）
+    results = await gather_limited(
+        *(_scan_channel_stats(ch, start_utc, end_utc, target_user_id, collect_top_posts) for ch in channels),
+        return_exceptions=True
+    )
 
-        try:
-            async for message in channel.history(
-                after=start_utc,
-                before=end_utc,
-                limit=None,
-                oldest_first=True
-            ):
-                msg_count += 1
-                if msg_count % 50 == 0:
-                    print(f"[collect_stats] Processed {msg_count} messages, {reaction_count} reactions...", flush=True)
-
-                # Bot除外
-                if EXCLUDE_BOTS and message.author.bot:
-                    continue
-
-                user_id = message.author.id
-                display_name = message.author.display_name
-
-                if user_id not in user_stats:
-                    user_stats[user_id] = {
-                        "name": display_name,
-                        "hearts": 0,
-                        "posts": 0,
-                        "likes_given": 0
-                    }
-
-                # 特定ユーザーのみの場合は投稿カウントをスキップ
-                if target_user_id and message.author.id != target_user_id:
-                    pass  # 投稿カウントはスキップ、いいねした人の取得は続行
-                else:
-                    # 投稿数カウント
-                    user_stats[user_id]["posts"] += 1
-
-                # ❤️リアクションをカウント
-                msg_hearts = 0
-                for reaction in message.reactions:
-                    if str(reaction.emoji) == HEART_EMOJI:
-                        msg_hearts = reaction.count
-                        # 投稿者がもらったいいね数
-                        if not target_user_id or message.author.id == target_user_id:
-                            user_stats[user_id]["hearts"] += reaction.count
-
-                        # いいねした人を取得
-                        reaction_count += 1
-                        try:
-                            async for reactor in reaction.users():
-                                if reactor.bot:
-                                    continue
-                                likes_given[reactor.id] += 1
-                                # ユーザー情報を登録（まだなければ）
-                                if reactor.id not in user_stats:
-                                    user_stats[reactor.id] = {
-                                        "name": reactor.display_name,
-                                        "hearts": 0,
-                                        "posts": 0,
-                                        "likes_given": 0
-                                    }
-                        except discord.Forbidden:
-                            pass  # リアクションユーザー取得権限がない場合はスキップ
-                        break
-
-                # トップ投稿を収集
-                if collect_top_posts and msg_hearts > 0:
-                    post_date = message.created_at.astimezone(JST).strftime("%Y-%m-%d %H:%M")
-                    top_posts.append({
-                        "author": display_name,
-                        "hearts": msg_hearts,
-                        "content": message.content,
-                        "date": post_date
-                    })
+    forbidden = [ch for ch, res in zip(channels, results) if isinstance(res, discord.Forbidden)]
+    if forbidden:
+        mentions = "、".join(f"<#{ch.id}>" for ch in forbidden)
+        raise Exception(f"チャンネル {mentions} の履歴を読む権限がありません。")
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
 
-        except discord.Forbidden:
-            raise Exception(f"チャンネル <#{channel_id}> の履歴を読む権限がありません。")
+    # チャンネルごとの結果をマージ
+    user_stats = {}
+    likes_given = Counter()
+    top_posts = []
+    msg_count = 0
+    reaction_count = 0
+    for res in results:
+        for uid, stats in res["user_stats"].items():
+            if uid not in user_stats:
+                user_stats[uid] = stats
+            else:
+                user_stats[uid]["hearts"] += stats["hearts"]
+                user_stats[uid]["posts"] += stats["posts"]
+        likes_given.update(res["likes_given"])
+        top_posts.extend(res["top_posts"])
+        msg_count += res["msg_count"]
+        reaction_count += res["reaction_count"]
 
     # いいねした回数をuser_statsに反映
     for uid, count in likes_given.items():
         if uid in user_stats:
             user_stats[uid]["likes_given"] = count
 
-    # トップ10投稿をソート
+    # トップ10投稿を選ぶ（全件ソートせず上位だけ取り出す。同数は投稿順のまま）
     if collect_top_posts:
-        top_posts = sorted(top_posts, key=lambda x: -x["hearts"])[:10]
+        top_posts = heapq.nlargest(10, top_posts, key=itemgetter("hearts"))
 
     print(f"[collect_stats] Done: {msg_count} messages, {reaction_count} reactions", flush=True)
-    return {"user_stats": user_stats, "top_posts": top_posts}
+    result = {"user_stats": user_stats, "top_posts": top_posts}
+    if snapshot_key is not None:
+        _all_snapshot[snapshot_key] = (time.monotonic(), latest_ids, _copy_stats_result(result))
+    return result
+
+
+def top_sorted(user_stats: dict) -> tuple[list[dict], int, int]:
+    """
+    ユーザー別集計に平均いいね数を付け、hearts降順 → posts降順 → name昇順 で返す。
+    1件以下ならソートしない。
+
+    Returns:
+        (並べ替えた行, 全体いいね数, 全体投稿数) - 合計は平均計算と同じループで数える
+    """
+    total_hearts = total_posts = 0
+    for stats in user_stats.values():
+        hearts = stats["hearts"]
+        posts = stats["posts"]
+        stats["avg_hearts"] = round(hearts / posts, 2) if posts > 0 else 0.0
+        total_hearts += hearts
+        total_posts += posts
+    rows = list(user_stats.values())
+    if len(rows) > 1:
+        # 安定ソートを2回（name昇順 → hearts・posts降順）。キー関数は C 実装の itemgetter
+        rows.sort(key=itemgetter("name"))
+        rows.sort(key=itemgetter("hearts", "posts"), reverse=True)
+    return rows, total_hearts, total_posts
+
+
+_DEPT_RE = re.compile(r'【(.+?)】\s*(.+)')
 
 
+@lru_cache(maxsize=4096)
 def extract_department(name: str) -> tuple[str, str]:
     """名前から部署を抽出する。【部署】名前 の形式を想定。"""
-    import re
-    match = re.match(r'【(.+?)】\s*(.+)', name)
+    match = _DEPT_RE.match(name)
     if match:
         return match.group(1), match.group(2)
     return "", name
 
 
+def _csv_buffer() -> tuple:
+    """
+    BOM付き UTF-8 の CSV を書き込む (テキストストリーム, csv.writer) を返す。
+    BytesIO に直接書き込み（StringIO → encode → BytesIO のコピーを避ける）、
+    BOM は先に書いて本文は C 実装の utf-8 エンコーダーで書く。書き終えたら _finish_csv に渡す。
+    """
+    buf = io.BytesIO()
+    buf.write(codecs.BOM_UTF8)
+    output = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    return output, csv.writer(output)
+
+
+def _finish_csv(output: io.TextIOWrapper) -> io.BytesIO:
+    """書き込みを終え、先頭に巻き戻した BytesIO を返す"""
+    output.flush()
+    buf = output.detach()
+    buf.seek(0)
+    return buf
+
+
 def generate_csv(data: list[dict], inactive_members: list[str] = None, include_total: bool = True) -> io.BytesIO:
     """集計データをCSVファイル（BytesIO）として生成する。"""
-    output = io.StringIO()
+    output, writer = _csv_buffer()
 
     # 日本語ヘッダー（部署を一番左に、いいねした回数を追加）
-    fieldnames_jp = ["部署", "名前", "いいね数", "いいねした回数", "投稿数", "平均いいね数", "全体いいね数", "全体投稿数"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames_jp)
-    writer.writeheader()
+    # 列: 部署, 名前, いいね数, いいねした回数, 投稿数, 平均いいね数, 全体いいね数, 全体投稿数
+    writer.writerow(["部署", "名前", "いいね数", "いいねした回数", "投稿数", "平均いいね数", "全体いいね数", "全体投稿数"])
 
-    # 先に合計を計算
-    total_hearts = sum(row["hearts"] for row in data)
-    total_posts = sum(row["posts"] for row in data)
-    total_likes_given = sum(row.get("likes_given", 0) for row in data)
+    # 先に合計を計算（1行目に全体値を出すため。1回のループでまとめて数える）
+    total_hearts = total_posts = total_likes_given = 0
+    for row in data:
+        total_hearts += row["hearts"]
+        total_posts += row["posts"]
+        total_likes_given += row.get("likes_given", 0)
 
-    # 投稿者データを書き込み
-    for i, row in enumerate(data):
+    def data_row(i: int, row: dict) -> tuple:
         dept, name_only = extract_department(row["name"])
-        row_data = {
-            "部署": dept,
-            "名前": name_only,
-            "いいね数": row["hearts"],
-            "いいねした回数": row.get("likes_given", 0),
-            "投稿数": row["posts"],
-            "平均いいね数": row["avg_hearts"],
-            "全体いいね数": "",
-            "全体投稿数": ""
-        }
-
-        # 1行目にのみ全体いいね数・全体投稿数を表示
-        if i == 0:
-            row_data["全体いいね数"] = total_hearts
-            row_data["全体投稿数"] = total_posts
+        return (
+            dept,
+            name_only,
+            row["hearts"],
+            row.get("likes_given", 0),
+            row["posts"],
+            row["avg_hearts"],
+            total_hearts if i == 0 else "",
+            total_posts if i == 0 else ""
+        )
 
-        writer.writerow(row_data)
+    # 投稿者データを書き込み（1行目にのみ全体いいね数・全体投稿数を表示）
+    writer.writerows(data_row(i, row) for i, row in enumerate(data))
 
     # 投稿していないメンバーを追加（部署と名前の列に）
-    inactive_list = inactive_members if inactive_members else []
-    for inactive_name in inactive_list:
-        dept, name_only = extract_department(inactive_name)
-        writer.writerow({
-            "部署": dept,
-            "名前": name_only,
-            "いいね数": 0,
-            "いいねした回数": 0,
-            "投稿数": 0,
-            "平均いいね数": 0,
-            "全体いいね数": "",
-            "全体投稿数": ""
-        })
+    writer.writerows(
+        (*extract_department(inactive_name), 0, 0, 0, 0, "", "")
+        for inactive_name in inactive_members or []
+    )
 
     # 合計行を追加
     if include_total:
         total_avg = round(total_hearts / total_posts, 2) if total_posts > 0 else 0
-        writer.writerow({
-            "部署": "",
-            "名前": "【合計】",
-            "いいね数": total_hearts,
-            "いいねした回数": total_likes_given,
-            "投稿数": total_posts,
-            "平均いいね数": total_avg,
-            "全体いいね数": "",
-            "全体投稿数": ""
-        })
+        writer.writerow(("", "【合計】", total_hearts, total_likes_given, total_posts, total_avg, "", ""))
 
-    csv_bytes = output.getvalue().encode("utf-8-sig")
-    return io.BytesIO(csv_bytes)
+    return _finish_csv(output)
 
 
 # =============================================================================
-# スラッシュコマンド: /date_report（日時範囲指定）
+# 権限チェック
 # =============================================================================
+def require_allowed(func):
+    """
+    スラッシュコマンド用デコレーター。
+    ALLOWED_USER_IDS に含まれないユーザーには権限エラーを返して本体を実行しない。
+    @tree.command / @app_commands.describe より内側（async def の直上）に付けること。
+    """
+    @wraps(func)
+    async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+        if ALLOWED_USER_IDS and interaction.user.id not in ALLOWED_USER_IDS:
+            await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
+            return
+        return await func(interaction, *args, **kwargs)
+    return wrapper
+
+
+# =============================================================================
+# レポート送信（/date_report・/report・/ask・メンション共通）
+# =============================================================================
+async def send_report_dm(
+    user: discord.abc.User,
+    guild: discord.Guild,
+    user_stats: dict,
+    period_label: str,
+    filename: str
+) -> bool:
+    """
+    集計結果を並べ替えてCSV（投稿なしメンバーと合計を含む）を作り、DMで送る。
+
+    Returns:
+        送信できたか（DMを受け付けていない場合は False）
+    """
+    # 並べ替えとCSV生成は大規模時にイベントループを塞がないよう別スレッドで
+    sorted_data, total_hearts, total_posts = await asyncio.to_thread(top_sorted, user_stats)
+    inactive_members = get_inactive_members(guild, user_stats)
+    csv_file = await asyncio.to_thread(generate_csv, sorted_data, inactive_members=inactive_members, include_total=True)
+
+    # レポートメッセージ作成（合計は top_sorted で数え済み）
+    report_message = f"**{period_label}** の集計結果です。\n"
+    report_message += f"📊 **全体合計**: いいね数 {total_hearts} / 投稿数 {total_posts}"
+
+    try:
+        await user.send(report_message, file=discord.File(csv_file, filename=filename))
+    except discord.Forbidden:
+        return False
+    return True
+
+
 # =============================================================================
 # スラッシュコマンド: /post_list（投稿一覧）
 # =============================================================================
+async def _scan_channel_posts(
+    channel: discord.TextChannel,
+    start_utc: datetime,
+    end_utc: datetime
+) -> list[dict]:
+    """1チャンネル分の投稿をいいね数付きで取得する（/post_list から並行実行される）"""
+    posts = []
+    async for message in iter_history(channel, start_utc, end_utc):
+        if EXCLUDE_BOTS and message.author.bot:
+            continue
+        reaction = find_heart_reaction(message)
+        post_date = message.created_at.astimezone(JST).strftime("%Y-%m-%d %H:%M")
+        dept, name_only = extract_department(message.author.display_name)
+        posts.append({
+            "date": post_date,
+            "dept": dept,
+            "author": name_only,
+            "hearts": reaction.count if reaction else 0,
+            "content": message.content.replace("\n", " ")
+        })
+    return posts
+
+
+def generate_post_list_csv(posts: list[dict], total_hearts: int) -> io.BytesIO:
+    """投稿一覧をCSVファイル（BytesIO）として生成する。"""
+    output, writer = _csv_buffer()
+    writer.writerow(["順位", "投稿日時", "部署", "投稿者", "いいね数", "投稿内容"])
+    writer.writerows(
+        (i, post["date"], post["dept"], post["author"], post["hearts"], post["content"])
+        for i, post in enumerate(posts, 1)
+    )
+    writer.writerow([])
+    writer.writerow(["", "", "", "【合計】", total_hearts, f"投稿数: {len(posts)}件"])
+    return _finish_csv(output)
+
+
 @tree.command(
     name="post_list",
     description="指定期間の全投稿を一覧表示（投稿者・内容・いいね数）",
@@ -534,13 +1515,10 @@ def generate_csv(data: list[dict], inactive_members: list[str] = None, include_t
     start="開始日時（YYYY-MM-DD HH:MM）例: 2026-02-15 11:00",
     end="終了日時（YYYY-MM-DD HH:MM）例: 2026-02-15 23:59"
 )
+@require_allowed
 async def post_list(interaction: discord.Interaction, start: str, end: str):
     """指定期間の全投稿をいいね数付きで一覧出力"""
 
-    if ALLOWED_USER_IDS and interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
-        return
-
     await interaction.response.defer(ephemeral=True)
 
     # 日時パース
@@ -558,39 +1536,31 @@ async def post_list(interaction: discord.Interaction, start: str, end: str):
         await interaction.followup.send("開始日時は終了日時より前にしてください。", ephemeral=True)
         return
 
-    start_utc = start_dt.astimezone(UTC)
-    end_utc = end_dt.astimezone(UTC)
+    # start_dt / end_dt はタイムゾーン付きなので UTC へ変換せずそのまま渡す
+    start_utc, end_utc = start_dt, end_dt
 
-    # 全投稿を収集
-    posts = []
-    total_hearts = 0
+    # 全投稿を収集（チャンネルごとに並行取得）
+    channels = []
     for channel_id in CHANNEL_IDS:
         channel = interaction.guild.get_channel(channel_id)
-        if not channel or not isinstance(channel, discord.TextChannel):
-            continue
-        try:
-            async for message in channel.history(after=start_utc, before=end_utc, limit=None, oldest_first=True):
-                if EXCLUDE_BOTS and message.author.bot:
-                    continue
-                hearts = 0
-                for reaction in message.reactions:
-                    if str(reaction.emoji) == HEART_EMOJI:
-                        hearts = reaction.count
-                        break
-                total_hearts += hearts
-                post_date = message.created_at.astimezone(JST).strftime("%Y-%m-%d %H:%M")
-                dept, name_only = extract_department(message.author.display_name)
-                content = message.content.replace("\n", " ")
-                posts.append({
-                    "date": post_date,
-                    "dept": dept,
-                    "author": name_only,
-                    "hearts": hearts,
-                    "content": content
-                })
-        except discord.Forbidden:
-            await interaction.followup.send(f"チャンネル <#{channel_id}> の履歴を読む権限がありません。", ephemeral=True)
-            return
+        if channel and isinstance(channel, discord.TextChannel):
+            channels.append(channel)
+
+    results = await gather_limited(
+        *(_scan_channel_posts(ch, start_utc, end_utc) for ch in channels),
+        return_exceptions=True
+    )
+    forbidden = [ch for ch, res in zip(channels, results) if isinstance(res, discord.Forbidden)]
+    if forbidden:
+        mentions = "、".join(f"<#{ch.id}>" for ch in forbidden)
+        await interaction.followup.send(f"チャンネル {mentions} の履歴を読む権限がありません。", ephemeral=True)
+        return
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
+
+    posts = [post for res in results for post in res]
+    total_hearts = sum(post["hearts"] for post in posts)
 
     if not posts:
         await interaction.followup.send(
@@ -602,16 +1572,8 @@ async def post_list(interaction: discord.Interaction, start: str, end: str):
     # いいね数降順でソート
     posts.sort(key=lambda x: -x["hearts"])
 
-    # CSV生成
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["順位", "投稿日時", "部署", "投稿者", "いいね数", "投稿内容"])
-    for i, post in enumerate(posts, 1):
-        writer.writerow([i, post["date"], post["dept"], post["author"], post["hearts"], post["content"]])
-    writer.writerow([])
-    writer.writerow(["", "", "", "【合計】", total_hearts, f"投稿数: {len(posts)}件"])
-
-    csv_bytes = output.getvalue().encode("utf-8-sig")
+    # CSV生成（イベントループを止めないよう別スレッドで）
+    csv_buf = await asyncio.to_thread(generate_post_list_csv, posts, total_hearts)
     filename = f"post_list_{start.strip().replace(' ', '_')}_{end.strip().replace(' ', '_')}.csv"
 
     summary = (
@@ -623,7 +1585,7 @@ async def post_list(interaction: discord.Interaction, start: str, end: str):
     try:
         await interaction.user.send(
             summary,
-            file=discord.File(io.BytesIO(csv_bytes), filename=filename)
+            file=discord.File(csv_buf, filename=filename)
         )
         await interaction.followup.send("投稿一覧をDMに送信しました。", ephemeral=True)
     except discord.Forbidden:
@@ -642,17 +1604,10 @@ async def post_list(interaction: discord.Interaction, start: str, end: str):
     start="開始日時（YYYY-MM-DD HH:MM）例: 2025-02-15 11:16",
     end="終了日時（YYYY-MM-DD HH:MM）例: 2025-02-15 23:59"
 )
+@require_allowed
 async def date_report(interaction: discord.Interaction, start: str, end: str):
     """日時範囲を指定してレポートを生成"""
 
-    # 権限チェック
-    if ALLOWED_USER_IDS and interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message(
-            "このコマンドを実行する権限がありません。",
-            ephemeral=True
-        )
-        return
-
     await interaction.response.defer(ephemeral=True)
 
     # 日時パース
@@ -672,8 +1627,8 @@ async def date_report(interaction: discord.Interaction, start: str, end: str):
         await interaction.followup.send("開始日時は終了日時より前にしてください。", ephemeral=True)
         return
 
-    start_utc = start_dt.astimezone(UTC)
-    end_utc = end_dt.astimezone(UTC)
+    # start_dt / end_dt はタイムゾーン付きなので UTC へ変換せずそのまま渡す
+    start_utc, end_utc = start_dt, end_dt
 
     # 集計実行
     try:
@@ -692,46 +1647,11 @@ async def date_report(interaction: discord.Interaction, start: str, end: str):
         )
         return
 
-    # 平均いいね数を計算
-    for user_id, stats in user_stats.items():
-        if stats["posts"] > 0:
-            stats["avg_hearts"] = round(stats["hearts"] / stats["posts"], 2)
-        else:
-            stats["avg_hearts"] = 0.0
-
-    # ソート: hearts降順 → posts降順 → name昇順
-    sorted_data = sorted(
-        user_stats.values(),
-        key=lambda x: (-x["hearts"], -x["posts"], x["name"])
-    )
-
-    # 投稿していないメンバーを取得
-    posted_user_ids = set(user_stats.keys())
-    inactive_members = []
-    for member in interaction.guild.members:
-        if member.bot:
-            continue
-        if member.id not in posted_user_ids:
-            inactive_members.append(member.display_name)
-
-    # CSV生成
-    csv_file = generate_csv(sorted_data, inactive_members=inactive_members, include_total=True)
+    # レポート（CSV）をDMで送信
     filename = f"{start.strip().replace(' ', '_')}_{end.strip().replace(' ', '_')}_report.csv"
-
-    # レポートメッセージ作成
-    total_hearts = sum(s["hearts"] for s in sorted_data)
-    total_posts = sum(s["posts"] for s in sorted_data)
-    report_message = f"**{period_label}** の集計結果です。\n"
-    report_message += f"📊 **全体合計**: いいね数 {total_hearts} / 投稿数 {total_posts}"
-
-    # DM送信
-    try:
-        await interaction.user.send(
-            report_message,
-            file=discord.File(csv_file, filename=filename)
-        )
+    if await send_report_dm(interaction.user, interaction.guild, user_stats, period_label, filename):
         await interaction.followup.send("DMにCSVを送信しました。", ephemeral=True)
-    except discord.Forbidden:
+    else:
         await interaction.followup.send(
             "DMを送信できませんでした。DM受信設定を確認してください。",
             ephemeral=True
@@ -747,28 +1667,21 @@ async def date_report(interaction: discord.Interaction, start: str, end: str):
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
 @app_commands.describe(period="集計期間（YYYY-MM / last / all）")
+@require_allowed
 async def report(interaction: discord.Interaction, period: str = "last"):
     """従来の /report コマンド（システム的なパース）"""
 
-    # 権限チェック
-    if ALLOWED_USER_IDS and interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message(
-            "このコマンドを実行する権限がありません。",
-            ephemeral=True
-        )
-        return
-
     await interaction.response.defer(ephemeral=True)
 
     # 期間パース（システム的）
     try:
-        if period.lower() == "all":
+        if _ALL_RE.match(period):
             parsed_period = "all"
         elif period.lower() == "last":
             parsed_period = "last"
         else:
             # YYYY-MM or YYYY/MM
-            match = re.match(r'(\d{4})[-/](\d{1,2})', period)
+            match = _YM_RE.match(period)
             if match:
                 parsed_period = {"year": int(match.group(1)), "month": int(match.group(2))}
             else:
@@ -782,9 +1695,10 @@ async def report(interaction: discord.Interaction, period: str = "last"):
         return
 
     # 期間計算
-    start_dt, end_dt = get_period_range(parsed_period)
-    start_utc = start_dt.astimezone(UTC) if start_dt else None
-    end_utc = end_dt.astimezone(UTC) if end_dt else None
+    now_jst = datetime.now(JST)
+    start_dt, end_dt = get_period_range(parsed_period, now_jst)
+    period_str = format_period_str(parsed_period, now_jst)
+    start_utc, end_utc = start_dt, end_dt
 
     # 集計実行
     try:
@@ -796,51 +1710,16 @@ async def report(interaction: discord.Interaction, period: str = "last"):
 
     if not user_stats:
         await interaction.followup.send(
-            f"{format_period_str(parsed_period)} のデータがありませんでした。",
+            f"{period_str} のデータがありませんでした。",
             ephemeral=True
         )
         return
 
-    # 平均いいね数を計算
-    for user_id, stats in user_stats.items():
-        if stats["posts"] > 0:
-            stats["avg_hearts"] = round(stats["hearts"] / stats["posts"], 2)
-        else:
-            stats["avg_hearts"] = 0.0
-
-    # ソート: hearts降順 → posts降順 → name昇順
-    sorted_data = sorted(
-        user_stats.values(),
-        key=lambda x: (-x["hearts"], -x["posts"], x["name"])
-    )
-
-    # 投稿していないメンバーを取得
-    posted_user_ids = set(user_stats.keys())
-    inactive_members = []
-    for member in interaction.guild.members:
-        if member.bot:
-            continue
-        if member.id not in posted_user_ids:
-            inactive_members.append(member.display_name)
-
-    # CSV生成（投稿なしメンバーと合計を含む）
-    csv_file = generate_csv(sorted_data, inactive_members=inactive_members, include_total=True)
-    filename = f"{format_period_str(parsed_period).replace('年', '-').replace('月', '')}_report.csv"
-
-    # レポートメッセージ作成
-    total_hearts = sum(s["hearts"] for s in sorted_data)
-    total_posts = sum(s["posts"] for s in sorted_data)
-    report_message = f"**{format_period_str(parsed_period)}** の集計結果です。\n"
-    report_message += f"📊 **全体合計**: いいね数 {total_hearts} / 投稿数 {total_posts}"
-
-    # DM送信
-    try:
-        await interaction.user.send(
-            report_message,
-            file=discord.File(csv_file, filename=filename)
-        )
+    # レポート（CSV）をDMで送信
+    filename = f"{period_str.replace('年', '-').replace('月', '')}_report.csv"
+    if await send_report_dm(interaction.user, interaction.guild, user_stats, period_str, filename):
         await interaction.followup.send("DMにCSVを送信しました。", ephemeral=True)
-    except discord.Forbidden:
+    else:
         await interaction.followup.send(
             "DMを送信できませんでした。DM受信設定を確認してください。",
             ephemeral=True
@@ -856,17 +1735,10 @@ async def report(interaction: discord.Interaction, period: str = "last"):
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
 @app_commands.describe(query="質問や依頼（例: 先月のレポート、@田中 のいいね数）")
+@require_allowed
 async def ask(interaction: discord.Interaction, query: str):
     """AI統合の自然言語コマンド"""
 
-    # 権限チェック
-    if ALLOWED_USER_IDS and interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message(
-            "このコマンドを実行する権限がありません。",
-            ephemeral=True
-        )
-        return
-
     await interaction.response.defer(ephemeral=True)
 
     # サーバーメンバー取得
@@ -875,11 +1747,12 @@ async def ask(interaction: discord.Interaction, query: str):
         await interaction.followup.send("サーバー内で実行してください。", ephemeral=True)
         return
 
-    members = [{"id": m.id, "name": m.display_name} for m in guild.members if not m.bot]
-    current_date = datetime.now(JST).strftime("%Y-%m-%d")
+    members = get_members_cached(guild)
+    now_jst = datetime.now(JST)
+    current_date = now_jst.strftime("%Y-%m-%d")
 
-    # AI解析
-    intent = parse_intent_with_ai(query, current_date, members)
+    # AI解析（AI・コンテキストキャッシュの呼び出しはブロッキングなので別スレッドで）
+    intent = await asyncio.to_thread(parse_intent_with_ai, query, current_date, members)
 
     if intent.get("error"):
         await interaction.followup.send(
@@ -898,10 +1771,9 @@ async def ask(interaction: discord.Interaction, query: str):
 
     # 期間計算
     period = intent["period"]
-    start_dt, end_dt = get_period_range(period)
-    start_utc = start_dt.astimezone(UTC) if start_dt else None
-    end_utc = end_dt.astimezone(UTC) if end_dt else None
-    period_str = format_period_str(period)
+    start_dt, end_dt = get_period_range(period, now_jst)
+    start_utc, end_utc = start_dt, end_dt
+    period_str = format_period_str(period, now_jst)
 
     # 集計実行
     target_user_id = intent.get("target_user_id")
@@ -928,7 +1800,7 @@ async def ask(interaction: discord.Interaction, query: str):
             )
             return
 
-        data = list(user_stats.values())[0]
+        data = next(iter(user_stats.values()))
         avg_hearts = round(data['hearts'] / data['posts'], 2) if data['posts'] > 0 else 0.0
         await interaction.followup.send(
             f"**{period_str}** の **{data['name']}** さん\n"
@@ -947,44 +1819,11 @@ async def ask(interaction: discord.Interaction, query: str):
             )
             return
 
-        # 平均いいね数を計算
-        for user_id, stats in user_stats.items():
-            if stats["posts"] > 0:
-                stats["avg_hearts"] = round(stats["hearts"] / stats["posts"], 2)
-            else:
-                stats["avg_hearts"] = 0.0
-
-        sorted_data = sorted(
-            user_stats.values(),
-            key=lambda x: (-x["hearts"], -x["posts"], x["name"])
-        )
-
-        # 投稿していないメンバーを取得
-        posted_user_ids = set(user_stats.keys())
-        inactive_members = []
-        for member in guild.members:
-            if member.bot:
-                continue
-            if member.id not in posted_user_ids:
-                inactive_members.append(member.display_name)
-
-        # CSV生成（投稿なしメンバーと合計を含む）
-        csv_file = generate_csv(sorted_data, inactive_members=inactive_members, include_total=True)
+        # レポート（CSV）をDMで送信
         filename = f"{period_str.replace('年', '-').replace('月', '')}_report.csv"
-
-        # レポートメッセージ作成
-        total_hearts = sum(s["hearts"] for s in sorted_data)
-        total_posts = sum(s["posts"] for s in sorted_data)
-        report_message = f"**{period_str}** の集計結果です。\n"
-        report_message += f"📊 **全体合計**: いいね数 {total_hearts} / 投稿数 {total_posts}"
-
-        try:
-            await interaction.user.send(
-                report_message,
-                file=discord.File(csv_file, filename=filename)
-            )
+        if await send_report_dm(interaction.user, guild, user_stats, period_str, filename):
             await interaction.followup.send("DMにCSVを送信しました。", ephemeral=True)
-        except discord.Forbidden:
+        else:
             await interaction.followup.send(
                 "DMを送信できませんでした。DM受信設定を確認してください。",
                 ephemeral=True
@@ -998,6 +1837,16 @@ async def ask(interaction: discord.Interaction, query: str):
 async def on_message(message: discord.Message):
     """@Bot メンションでの呼び出しを処理"""
 
+    # 集計対象チャンネルの投稿はインデックスに記録
+    if message.channel.id in CHANNEL_IDS:
+        index_message(message, [])
+        if message.channel.id in _index_ready:
+            index_db.execute(
+                "INSERT OR REPLACE INTO sync_state (channel_id, last_message_id) VALUES (?, ?)",
+                (message.channel.id, message.id)
+            )
+        index_db.commit()
+
     # 自分自身のメッセージは無視
     if message.author.bot:
         return
@@ -1029,11 +1878,12 @@ async def on_message(message: discord.Message):
 
     # サーバーメンバー取得
     guild = message.guild
-    members = [{"id": m.id, "name": m.display_name} for m in guild.members if not m.bot]
-    current_date = datetime.now(JST).strftime("%Y-%m-%d")
+    members = get_members_cached(guild)
+    now_jst = datetime.now(JST)
+    current_date = now_jst.strftime("%Y-%m-%d")
 
-    # AI解析
-    intent = parse_intent_with_ai(query, current_date, members)
+    # AI解析（AI・コンテキストキャッシュの呼び出しはブロッキングなので別スレッドで）
+    intent = await asyncio.to_thread(parse_intent_with_ai, query, current_date, members)
 
     if intent.get("error"):
         error_msg = f"解析エラー: {intent['error']}"
@@ -1055,10 +1905,9 @@ async def on_message(message: discord.Message):
 
     # 期間計算
     period = intent["period"]
-    start_dt, end_dt = get_period_range(period)
-    start_utc = start_dt.astimezone(UTC) if start_dt else None
-    end_utc = end_dt.astimezone(UTC) if end_dt else None
-    period_str = format_period_str(period)
+    start_dt, end_dt = get_period_range(period, now_jst)
+    start_utc, end_utc = start_dt, end_dt
+    period_str = format_period_str(period, now_jst)
 
     # 集計実行
     target_user_id = intent.get("target_user_id")
@@ -1096,91 +1945,178 @@ async def on_message(message: discord.Message):
                 print("DM failed: user has DMs disabled.")
         return
 
-    # 平均いいね数を計算
-    for user_id, stats in user_stats.items():
-        if stats["posts"] > 0:
-            stats["avg_hearts"] = round(stats["hearts"] / stats["posts"], 2)
-        else:
-            stats["avg_hearts"] = 0.0
+    # レポート（CSV）をDMで送信
+    filename = f"{period_str.replace('年', '-').replace('月', '')}_report.csv"
+    if not await send_report_dm(message.author, guild, user_stats, period_str, filename):
+        print("DM failed: user has DMs disabled.")
+
+
+# =============================================================================
+# イベント: メッセージインデックス更新
+# =============================================================================
+@client.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    """❤️が付いたらインデックスのいいね数を加算"""
+    if payload.channel_id not in CHANNEL_IDS or payload.emoji.name != HEART_EMOJI:
+        return
+    member = payload.member
+    cur = index_db.execute(
+        "INSERT OR IGNORE INTO heart_users (message_id, user_id, user_name, is_bot) VALUES (?, ?, ?, ?)",
+        (
+            payload.message_id, payload.user_id,
+            member.display_name if member else str(payload.user_id),
+            int(member.bot) if member else 0
+        )
+    )
+    if cur.rowcount:
+        index_db.execute("UPDATE msgs SET hearts = hearts + 1 WHERE id = ?", (payload.message_id,))
+    index_db.commit()
+
 
-    # ソート: hearts降順 → posts降順 → name昇順
-    sorted_data = sorted(
-        user_stats.values(),
-        key=lambda x: (-x["hearts"], -x["posts"], x["name"])
+@client.event
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
+    """❤️が外されたらインデックスのいいね数を減算"""
+    if payload.channel_id not in CHANNEL_IDS or payload.emoji.name != HEART_EMOJI:
+        return
+    cur = index_db.execute(
+        "DELETE FROM heart_users WHERE message_id = ? AND user_id = ?",
+        (payload.message_id, payload.user_id)
     )
+    if cur.rowcount:
+        index_db.execute("UPDATE msgs SET hearts = MAX(hearts - 1, 0) WHERE id = ?", (payload.message_id,))
+    index_db.commit()
 
-    # 投稿していないメンバーを取得
-    posted_user_ids = set(user_stats.keys())
-    inactive_members = []
-    for member in guild.members:
-        if member.bot:
-            continue
-        if member.id not in posted_user_ids:
-            inactive_members.append(member.display_name)
 
-    # CSV生成（投稿なしメンバーと合計を含む）
-    csv_file = generate_csv(sorted_data, inactive_members=inactive_members, include_total=True)
-    filename = f"{period_str.replace('年', '-').replace('月', '')}_report.csv"
+@client.event
+async def on_raw_reaction_clear(payload: discord.RawReactionClearEvent):
+    """リアクション全削除"""
+    if payload.channel_id not in CHANNEL_IDS:
+        return
+    index_db.execute("DELETE FROM heart_users WHERE message_id = ?", (payload.message_id,))
+    index_db.execute("UPDATE msgs SET hearts = 0 WHERE id = ?", (payload.message_id,))
+    index_db.commit()
 
-    # レポートメッセージ作成
-    total_hearts = sum(s["hearts"] for s in sorted_data)
-    total_posts = sum(s["posts"] for s in sorted_data)
-    report_message = f"**{period_str}** の集計結果です。\n"
-    report_message += f"📊 **全体合計**: いいね数 {total_hearts} / 投稿数 {total_posts}"
 
-    # DMで送信
-    try:
-        await message.author.send(
-            report_message,
-            file=discord.File(csv_file, filename=filename)
+@client.event
+async def on_raw_reaction_clear_emoji(payload: discord.RawReactionClearEmojiEvent):
+    """特定絵文字のリアクション全削除"""
+    if payload.channel_id not in CHANNEL_IDS or payload.emoji.name != HEART_EMOJI:
+        return
+    index_db.execute("DELETE FROM heart_users WHERE message_id = ?", (payload.message_id,))
+    index_db.execute("UPDATE msgs SET hearts = 0 WHERE id = ?", (payload.message_id,))
+    index_db.commit()
+
+
+@client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    """投稿内容の編集を反映"""
+    if "content" not in payload.data:
+        return
+    content = payload.data["content"]
+    if payload.channel_id in CHANNEL_IDS:
+        index_db.execute("UPDATE msgs SET content = ? WHERE id = ?", (content, payload.message_id))
+        index_db.commit()
+    elif payload.channel_id in (AI_THREAD_ID, AI_CHANNEL_ID):
+        # 取り込み済みの本気AI投稿だけ抽出し直す（AI呼び出しは別スレッドで）
+        row = index_db.execute("SELECT source FROM ai_posts WHERE message_id = ?", (payload.message_id,)).fetchone()
+        if not row:
+            return
+        name, urls, sample = _ai_post_fields(row[0], content)
+        retry_text, failures = "", 0
+        if row[0] == AI_SOURCE_THREAD and name is None:
+            name = (await asyncio.to_thread(extract_names_with_ai_batch, [content]))[0]
+            if name is AI_NAME_FAILED:
+                # AIが使えなければ名前なしで保存し、次回以降の取り込みで問い合わせ直す
+                name = None
+                retry_text, failures = content[:500], 1 if ai_model is not None else 0
+            elif name:
+                sample = ""
+        edited_at = discord.utils.parse_time(payload.data.get("edited_timestamp"))
+        index_db.execute(
+            "UPDATE ai_posts SET name = ?, urls = ?, sample = ?, retry_text = ?, ai_failures = ?, edited_ts = ? "
+            "WHERE message_id = ?",
+            (name, urls, sample, retry_text, failures, _to_ms(edited_at) if edited_at else 0, payload.message_id)
         )
-    except discord.Forbidden:
-        print("DM failed: user has DMs disabled.")
+        index_db.commit()
+
+
+@client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """削除された投稿をインデックスから除去"""
+    if payload.channel_id in CHANNEL_IDS:
+        index_db.execute("DELETE FROM msgs WHERE id = ?", (payload.message_id,))
+        index_db.execute("DELETE FROM heart_users WHERE message_id = ?", (payload.message_id,))
+        index_db.commit()
+    elif payload.channel_id in (AI_THREAD_ID, AI_CHANNEL_ID):
+        index_db.execute("DELETE FROM ai_posts WHERE message_id = ?", (payload.message_id,))
+        index_db.commit()
 
 
 # =============================================================================
 # ランチ制度: 部署抽出
 # =============================================================================
+_DEPT_ONLY_RE = re.compile(r'【(.+?)】')
+
+
+@lru_cache(maxsize=4096)
 def extract_department_from_nickname(nickname: str) -> str | None:
     """
     ニックネームから部署を抽出する。
     形式: 【部署名】名前（ニックネーム）
     """
-    match = re.match(r'【(.+?)】', nickname)
+    match = _DEPT_ONLY_RE.match(nickname)
     return match.group(1) if match else None
 
 
+@lru_cache(maxsize=4096)
+def _extract_departments(nickname: str) -> tuple[str, ...]:
+    """extract_departments_list の本体（キャッシュ共有のため不変のタプルで返す）"""
+    match = _DEPT_ONLY_RE.match(nickname)
+    if not match:
+        return ("不明",)
+    dept_str = match.group(1)
+    # /で分割して複数部署を取得
+    depts = tuple(d.strip() for d in dept_str.split('/') if d.strip())
+    return depts if depts else ("不明",)
+
+
 def extract_departments_list(nickname: str) -> list[str]:
     """
     ニックネームから部署をリストで抽出する。
     例: 【CTO室/マーケ】畑 来世人 → ["CTO室", "マーケ"]
     """
-    match = re.match(r'【(.+?)】', nickname)
-    if not match:
-        return ["不明"]
-    dept_str = match.group(1)
-    # /で分割して複数部署を取得
-    depts = [d.strip() for d in dept_str.split('/') if d.strip()]
-    return depts if depts else ["不明"]
+    return list(_extract_departments(nickname))
 
 
+@lru_cache(maxsize=4096)
 def extract_name_from_nickname(nickname: str) -> str:
     """ニックネームから名前部分を抽出する。"""
     # 改行を除去
     name = nickname.replace("\n", "").replace("\r", "")
-    # 【部署】を除去
-    name = re.sub(r'【.+?】', '', name).strip()
-    # （ニックネーム）を除去
-    name = re.sub(r'（.+?）$', '', name).strip()
-    name = re.sub(r'\(.+?\)$', '', name).strip()
+    # 【部署】を除去（中身が1文字以上ある【…】をすべて）
+    start = name.find("【")
+    while start >= 0:
+        end = name.find("】", start + 2)
+        if end >= 0:
+            name = name[:start] + name[end + 1:]
+            start = name.find("【", start)
+        else:
+            start = name.find("【", start + 1)
+    name = name.strip()
+    # 末尾の（ニックネーム）を除去（末尾の括弧に対応する最初の開き括弧から）
+    for open_paren, close_paren in (("（", "）"), ("(", ")")):
+        if name.endswith(close_paren):
+            start = name.find(open_paren, 0, len(name) - 2)
+            if start >= 0:
+                name = name[:start]
+        name = name.strip()
     return name
 
 
 def normalize_name(name: str) -> str:
     """名前を正規化する（スペース・改行除去、Unicode正規化）"""
-    import unicodedata
-    # Unicode正規化（異体字などを統一）
-    normalized = unicodedata.normalize('NFKC', name)
+    # Unicode正規化（異体字などを統一）。ASCII のみなら NFKC で変化しないので省略
+    normalized = name if name.isascii() else unicodedata.normalize('NFKC', name)
     # スペース・改行除去（全角・半角）
     normalized = normalized.replace(" ", "").replace("　", "")
     normalized = normalized.replace("\n", "").replace("\r", "")
@@ -1188,27 +2124,123 @@ def normalize_name(name: str) -> str:
     return normalized
 
 
-def find_member_by_name(guild: discord.Guild, form_name: str) -> discord.Member | None:
-    """フォームの名前からDiscordメンバーを検索する（マッチング甘め）"""
-    form_normalized = normalize_name(form_name)
+def _bigrams(text: str) -> set[str]:
+    """文字列に含まれる連続2文字の集合"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def build_member_index(guild: discord.Guild) -> dict:
+    """
+    find_member_by_name 用の索引を作る（集計1回につき1度だけ作る）。
 
+    Returns:
+        {
+            "exact": {正規化した名前: メンバー},                  # 完全一致用
+            "entries": [(正規化した名前, 表示名, メンバー), ...], # guild.members の順
+            "by_name": {正規化した名前: [entries の位置, ...]},
+            "name_grams": {2文字: {entries の位置, ...}},        # 正規化名の部分一致候補
+            "display_grams": {2文字: {entries の位置, ...}}      # 表示名の部分一致候補
+        }
+    """
+    exact = {}
+    entries = []
+    by_name = defaultdict(list)
+    name_grams = defaultdict(set)
+    display_grams = defaultdict(set)
     for member in guild.members:
         if member.bot:
             continue
         display = member.display_name or member.name
-        extracted_name = extract_name_from_nickname(display)
-        extracted_normalized = normalize_name(extracted_name)
+        normalized = normalize_name(extract_name_from_nickname(display))
+        pos = len(entries)
+        exact.setdefault(normalized, member)
+        entries.append((normalized, display, member))
+        by_name[normalized].append(pos)
+        for gram in _bigrams(normalized):
+            name_grams[gram].add(pos)
+        for gram in _bigrams(display):
+            display_grams[gram].add(pos)
+    return {
+        "exact": exact,
+        "entries": entries,
+        "by_name": by_name,
+        "name_grams": name_grams,
+        "display_grams": display_grams
+    }
 
-        # 正規化後の完全一致
-        if extracted_normalized == form_normalized:
-            return member
 
+# ギルドID -> (索引を作ったときのメンバー一覧キャッシュ, 索引)
+_member_index_cache: dict[int, tuple[list[dict], dict]] = {}
+
+
+def get_member_index(guild: discord.Guild) -> dict:
+    """
+    build_member_index の結果を返す。
+    メンバー一覧キャッシュ（get_members_cached）が作り直されるまでは同じ索引を使い回す。
+    """
+    members = get_members_cached(guild)
+    cached = _member_index_cache.get(guild.id)
+    if cached is not None and cached[0] is members:
+        return cached[1]
+    index = build_member_index(guild)
+    if guild.chunked:
+        _member_index_cache[guild.id] = (members, index)
+    return index
+
+
+def _gram_candidates(grams_index: dict, query: str) -> set[int] | None:
+    """query を部分文字列として含みうる entries の位置（2文字未満は絞り込めないので None）"""
+    if len(query) < 2:
+        return None
+    postings = sorted((grams_index.get(gram, set()) for gram in _bigrams(query)), key=len)
+    result = set(postings[0])
+    for positions in postings[1:]:
+        if not result:
+            break
+        result &= positions
+    return result
+
+
+def find_member_by_name(
+    guild: discord.Guild,
+    form_name: str,
+    member_index: dict | None = None
+) -> discord.Member | None:
+    """
+    フォームの名前からDiscordメンバーを検索する（マッチング甘め）。
+    完全一致は索引で引き、部分一致は2文字索引で候補を絞ってから判定する。
+    """
+    index = member_index if member_index is not None else build_member_index(guild)
+    entries = index["entries"]
+    form_normalized = normalize_name(form_name)
+
+    # 正規化後の完全一致
+    member = index["exact"].get(form_normalized)
+    if member is not None:
+        return member
+
+    form_stripped = form_name.strip()
+    name_candidates = _gram_candidates(index["name_grams"], form_normalized)
+    display_candidates = _gram_candidates(index["display_grams"], form_stripped)
+    if name_candidates is None or display_candidates is None:
+        positions = range(len(entries))
+    else:
+        # 正規化名がフォームの名前の一部になっているメンバー
+        by_name = index["by_name"]
+        n = len(form_normalized)
+        substrings = {form_normalized[i:j] for i in range(n + 1) for j in range(i, n + 1)}
+        contained = {pos for sub in substrings for pos in by_name.get(sub, ())}
+        # 元の順序で最初に条件を満たすメンバーを返す
+        positions = sorted(name_candidates | display_candidates | contained)
+
+    for pos in positions:
+        extracted_normalized, display, member = entries[pos]
         # 正規化後の部分一致
         if form_normalized in extracted_normalized or extracted_normalized in form_normalized:
             return member
 
         # 元の名前での部分一致
-        if form_name.strip() in display:
+        if form_stripped in display:
             return member
 
     return None
@@ -1221,33 +2253,76 @@ def get_member_department(member: discord.Member) -> str:
     return dept if dept else "不明"
 
 
+# ギルドID -> (結果を作ったときのメンバー索引, {フォームの名前: 部署タプル})
+# メンバー索引が作り直される（メンバーの参加・退出・表示名変更）と丸ごと無効になる。
+_name_departments_cache: dict[int, tuple[dict, dict[str, tuple[str, ...]]]] = {}
+
+
+def resolve_departments(guild: discord.Guild, form_name: str, member_index: dict) -> list[str]:
+    """
+    フォームの名前に対応するメンバーの部署リストを返す（見つからなければ ["不明"]）。
+    同じメンバー索引が使われている間は、レポートをまたいで検索結果を使い回す。
+    """
+    cached = _name_departments_cache.get(guild.id)
+    if cached is None or cached[0] is not member_index:
+        cached = (member_index, {})
+        _name_departments_cache[guild.id] = cached
+    names = cached[1]
+    depts = names.get(form_name)
+    if depts is None:
+        member = find_member_by_name(guild, form_name, member_index)
+        depts = _extract_departments(member.display_name or member.name) if member else ("不明",)
+        names[form_name] = depts
+    return list(depts)
+
+
 # =============================================================================
 # ランチ制度: フォームパーサー
 # =============================================================================
+LUNCH_FORM_FIELDS = (
+    "代表者名", "代表者の所属部署", "ランチ実施日", "参加人数",
+    "参加メンバー", "合計金額（税込）", "ランチ会議の感想をひとこと",
+)
+# フォームの既知の見出し「【項目名】\n」だけで区切る
+# （「【営業】田中 太郎」のような【】始まりの値を見出しと誤認しないため）
+_LUNCH_HEADER_RE = re.compile(
+    r'【(' + '|'.join(map(re.escape, LUNCH_FORM_FIELDS)) + r')】\s*\n'
+)
+_LEADING_INT_RE = re.compile(r'\d+')
+
+
+def _split_lunch_fields(content: str) -> dict[str, str]:
+    """フォーム本文を1回の走査で {項目名: 値} に分割する（同名項目は先勝ち）"""
+    parts = _LUNCH_HEADER_RE.split(content)
+    fields = {}
+    for name, value in zip(parts[1::2], parts[2::2]):
+        fields.setdefault(name, value)
+    return fields
+
+
 def parse_lunch_form(content: str) -> dict | None:
     """フォーム投稿からランチ制度データを抽出する。"""
     if '【代表者名】' not in content:
         return None
     try:
-        result = {}
-        match = re.search(r'【代表者名】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["representative"] = match.group(1).strip() if match else ""
-        match = re.search(r'【代表者の所属部署】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["department"] = match.group(1).strip() if match else ""
-        match = re.search(r'【ランチ実施日】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["date"] = match.group(1).strip() if match else ""
-        match = re.search(r'【参加人数】\s*\n(\d+)', content)
-        result["participant_count"] = int(match.group(1)) if match else 0
-        match = re.search(r'【参加メンバー】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        if match:
-            members_text = match.group(1).strip()
-            result["participants"] = [m.strip() for m in members_text.split('\n') if m.strip()]
-        else:
-            result["participants"] = []
-        match = re.search(r'【合計金額（税込）】\s*\n(\d+)', content)
-        result["total_amount"] = int(match.group(1)) if match else 0
-        match = re.search(r'【ランチ会議の感想をひとこと】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["comment"] = match.group(1).strip() if match else ""
+        fields = _split_lunch_fields(content)
+
+        def text(name: str) -> str:
+            return fields.get(name, "").strip()
+
+        def number(name: str) -> int:
+            match = _LEADING_INT_RE.match(fields.get(name, ""))
+            return int(match.group(0)) if match else 0
+
+        result = {
+            "representative": text("代表者名"),
+            "department": text("代表者の所属部署"),
+            "date": text("ランチ実施日"),
+            "participant_count": number("参加人数"),
+            "participants": [m.strip() for m in text("参加メンバー").split('\n') if m.strip()],
+            "total_amount": number("合計金額（税込）"),
+            "comment": text("ランチ会議の感想をひとこと")
+        }
         if not result["representative"] or not result["participants"]:
             return None
         return result
@@ -1258,6 +2333,16 @@ def parse_lunch_form(content: str) -> dict | None:
 # =============================================================================
 # ランチ制度: 集計関数
 # =============================================================================
+def _parse_lunch_batch(batch: list[tuple]) -> list[dict]:
+    """(メッセージID, 投稿日時, 本文) のまとまりをフォームとしてパースする（別スレッドで実行）"""
+    records = []
+    for message_id, posted_at, content in batch:
+        parsed = parse_lunch_form(content)
+        if parsed:
+            records.append({**parsed, "message_id": message_id, "posted_at": posted_at})
+    return records
+
+
 async def collect_lunch_stats(
     guild: discord.Guild,
     start_utc: datetime | None = None,
@@ -1265,149 +2350,203 @@ async def collect_lunch_stats(
 ) -> dict:
     """ランチ制度の利用状況を集計する。"""
     # スレッドから投稿を取得
-    thread = guild.get_thread(LUNCH_THREAD_ID)
-    if not thread:
-        try:
-            thread = await client.fetch_channel(LUNCH_THREAD_ID)
-        except Exception as e:
-            raise Exception(f"ランチ制度スレッド {LUNCH_THREAD_ID} が見つかりません: {e}")
+    try:
+        thread = await get_or_fetch_channel(guild, LUNCH_THREAD_ID)
+    except Exception as e:
+        raise Exception(f"ランチ制度スレッド {LUNCH_THREAD_ID} が見つかりません: {e}")
 
-    records = []
-    user_counts = defaultdict(int)
-    user_departments = {}
-    dept_counts = defaultdict(int)
+    # パース結果は保持せず、届いた順に集計値だけ更新する（メモリは参加者数に比例）
+    user_counts = Counter()
+    total_events = 0
     total_amount = 0
-    unique_participants = set()
 
-    try:
-        async for message in thread.history(
-            after=start_utc,
-            before=end_utc,
-            limit=None,
-            oldest_first=True
-        ):
-            # ランチ制度はBot投稿（フォーム連携）も集計対象
-            parsed = parse_lunch_form(message.content)
-            if not parsed:
-                continue
-            records.append({**parsed, "message_id": message.id, "posted_at": message.created_at})
-            for participant in parsed["participants"]:
-                user_counts[participant] += 1
-                unique_participants.add(participant)
-                if participant not in user_departments:
-                    member = find_member_by_name(guild, participant)
-                    if member:
-                        # 複数部署をリストで取得
-                        depts = extract_departments_list(member.display_name or member.name)
-                        user_departments[participant] = depts
-                    else:
-                        user_departments[participant] = ["不明"]
-                # 部署別カウント（各部署にカウント）
-                for dept in user_departments.get(participant, ["不明"]):
-                    dept_counts[dept] += 1
-            total_amount += parsed["total_amount"]
-    except discord.Forbidden:
-        raise Exception(f"スレッド <#{LUNCH_THREAD_ID}> の履歴を読む権限がありません。")
+    # 未来の期間などは履歴を読まない
+    if not is_empty_window(start_utc, end_utc):
+        # 全期間・終了なしの指定も区間に分けて並行取得できるよう、範囲を閉じておく
+        # （スレッド内の投稿はスレッド作成＝スレッドIDの時刻より前にはない）
+        created_utc = discord.utils.snowflake_time(thread.id) - timedelta(milliseconds=1)
+        scan_start = max(start_utc, created_utc) if start_utc else created_utc
+        scan_end = end_utc or datetime.now(UTC)
+
+        # 履歴の取得（通信）とフォームのパース（別スレッド）を並行させる
+        queue: asyncio.Queue[list[tuple] | None] = asyncio.Queue(maxsize=LUNCH_PARSE_QUEUE_SIZE)
+
+        async def produce() -> None:
+            # 終了（取得エラー時も）は None で知らせる。キャンセル時は送らない
+            # （キューが満杯のまま待つと、キャンセル済みのタスクが終わらなくなるため）
+            batch = []
+            try:
+                async with aclosing(iter_history(thread, scan_start, scan_end)) as messages:
+                    async for message in messages:
+                        # ランチ制度はBot投稿（フォーム連携）も集計対象
+                        content = message.content
+                        # フォーム以外の投稿はパース側へ送らない（parse_lunch_form と同じ判定）
+                        if '【代表者名】' not in content:
+                            continue
+                        batch.append((message.id, message.created_at, content))
+                        if len(batch) >= LUNCH_PARSE_BATCH:
+                            await queue.put(batch)
+                            batch = []
+                if batch:
+                    await queue.put(batch)
+            except Exception:
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (batch := await queue.get()) is not None:
+                for record in await asyncio.to_thread(_parse_lunch_batch, batch):
+                    total_events += 1
+                    # ループ内では参加回数を数えるだけにして、部署の解決は最後にまとめて行う
+                    user_counts.update(record["participants"])
+                    total_amount += record["total_amount"]
+            await producer  # 取得側の例外をここで受け取る
+        except discord.Forbidden:
+            raise Exception(f"スレッド <#{LUNCH_THREAD_ID}> の履歴を読む権限がありません。")
+        finally:
+            # 集計側のエラーやキャンセルで抜けた場合も取得側を止め、終わるまで待つ
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    # 参加者ごとに1回だけメンバー検索して部署を決める（常に1件以上のリスト）
+    member_index = get_member_index(guild)
+    user_departments = {}
+    for participant in user_counts:
+        user_departments[participant] = resolve_departments(guild, participant, member_index)
+
+    # 部署別カウント（参加回数を各部署に加算）
+    dept_counts = Counter()
+    for participant, count in user_counts.items():
+        for dept in user_departments[participant]:
+            dept_counts[dept] += count
 
     return {
-        "records": records,
         "user_departments": user_departments,
         "dept_counts": dict(dept_counts),
-        "user_counts": dict(user_counts),
-        "total_events": len(records),
-        "total_participants": sum(len(r["participants"]) for r in records),
-        "unique_participants": unique_participants,
+        "user_counts": user_counts,
+        "total_events": total_events,
+        "total_participants": sum(user_counts.values()),
+        "unique_participants": user_counts.keys(),  # 参加回数の集計キーがそのままユニーク参加者
         "total_amount": total_amount
     }
 
 
-def generate_lunch_csv(stats: dict, total_members: int) -> str:
-    """ランチ制度集計結果をCSV形式で出力"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+def sorted_by_count(counts: dict) -> list[tuple]:
+    """
+    (キー, 回数) を回数の多い順・同数はキー順で返す。
+    キー順に並べてから回数で安定ソートする（比較はC実装のまま、lambda を使わない）。
+    """
+    return sorted(sorted(counts.items()), key=itemgetter(1), reverse=True)
 
-    unique_count = len(stats["unique_participants"])
+
+def keys_by_value_desc(values: dict) -> list:
+    """
+    値の大きい順にキーを返す（同値は元の順序のまま）。
+    キー関数は lambda ではなく C 実装の dict.__getitem__ を使う。
+    """
+    return sorted(values, key=values.__getitem__, reverse=True)
+
+
+def user_dept_cells(user: tuple[str, int], user_departments: dict[str, list[str]]) -> tuple:
+    """
+    (名前, 回数) から CSV の「名前・部署・回数」セルを作る。
+    user_departments の値は常に1件以上の部署リスト（集計側で保証する）。
+    """
+    name, count = user
+    depts = user_departments.get(name, ["不明"])
+    # 複数部署の場合、名前と部署をセル内改行で表示
+    if len(depts) > 1:
+        return ("\n".join([name] * len(depts)), "\n".join(depts), count)
+    return (name, depts[0], count)
+
+
+def generate_lunch_csv(stats: dict, total_members: int) -> io.BytesIO:
+    """ランチ制度集計結果をCSV形式で出力（BytesIO）"""
+    output, writer = _csv_buffer()
+
+    unique_count = len(stats["user_counts"])
     usage_rate = (unique_count / total_members * 100) if total_members > 0 else 0
 
-    sorted_users = sorted(stats["user_counts"].items(), key=lambda x: (-x[1], x[0]))
-    sorted_depts = sorted(stats["dept_counts"].items(), key=lambda x: (-x[1], x[0]))
+    sorted_users = sorted_by_count(stats["user_counts"])
+    sorted_depts = sorted_by_count(stats["dept_counts"])
     summary_data = [
         ("チャンネルメンバー数", total_members),
         ("利用者数", unique_count),
         ("利用率", f"{usage_rate:.1f}%")
     ]
 
-    max_rows = max(len(sorted_users), len(sorted_depts), len(summary_data))
+    user_departments = stats["user_departments"]
+
+    def user_cells(user) -> tuple:
+        if user is None:
+            return ("", "", "")
+        return user_dept_cells(user, user_departments)
 
     writer.writerow(["名前", "部署", "参加回数", "", "部署", "部署別参加回数", "", "項目", "値"])
 
-    for i in range(max_rows):
-        row = []
-        if i < len(sorted_users):
-            name, count = sorted_users[i]
-            depts = stats["user_departments"].get(name, ["不明"])
-            # 複数部署の場合、名前と部署をセル内改行で表示
-            if isinstance(depts, list) and len(depts) > 1:
-                name_cell = "\n".join([name] * len(depts))
-                dept_cell = "\n".join(depts)
-            else:
-                name_cell = name
-                dept_cell = depts[0] if isinstance(depts, list) else depts
-            row.extend([name_cell, dept_cell, count])
-        else:
-            row.extend(["", "", ""])
-        row.append("")
-        if i < len(sorted_depts):
-            dept_name, dept_count = sorted_depts[i]
-            row.extend([dept_name, dept_count])
-        else:
-            row.extend(["", ""])
-        row.append("")
-        if i < len(summary_data):
-            item, value = summary_data[i]
-            row.extend([item, value])
-        else:
-            row.extend(["", ""])
-        writer.writerow(row)
+    # 3つの表を横に並べる（短い表は空欄で埋める）
+    writer.writerows(
+        user_cells(user) + ("",) + (dept or ("", "")) + ("",) + (summary or ("", ""))
+        for user, dept, summary in zip_longest(sorted_users, sorted_depts, summary_data)
+    )
 
-    return output.getvalue()
+    return _finish_csv(output)
 
 
 # =============================================================================
 # ランチ制度: 期間パース
 # =============================================================================
+_MONTHS_AGO_RE = re.compile(r'^-(\d+)$')
+_LUNCH_YM_RE = re.compile(r'^(\d{4})-(\d{2})$')
+# 全角の空白・マイナス記号（長音記号も含む）を半角にそろえる
+_LUNCH_PERIOD_TRANSLATE = str.maketrans({"\u3000": " ", "－": "-", "−": "-", "ー": "-"})
+
+# 期間のキーワード → 種別（1回の dict 引きで判定する）
+_LUNCH_PERIOD_KEYWORDS = {
+    "all": "all", "全期間": "all",
+    "last": "last", "先月": "last", "-1": "last",
+    "this": "this", "今月": "this", "0": "this",
+}
+
+
 def parse_lunch_period(period: str) -> tuple[int, int] | str | None:
     """
     期間文字列をパースして (year, month) または "all" を返す。
     対応: "2024-01", "last", "this", "-1"〜"-N", "all"
     """
-    period_lower = period.lower().strip()
-    now = datetime.now(JST)
-
-    if period_lower in ("all", "全期間"):
+    period_lower = period.translate(_LUNCH_PERIOD_TRANSLATE).strip().lower()
+    # 現在時刻は相対指定（先月・今月・N ヶ月前）のときだけ取得する
+    keyword = _LUNCH_PERIOD_KEYWORDS.get(period_lower)
+    if keyword == "all":
         return "all"
-    if period_lower in ("last", "先月", "-1"):
+    if keyword == "last":
+        now = datetime.now(JST)
         if now.month == 1:
             return (now.year - 1, 12)
         return (now.year, now.month - 1)
-    if period_lower in ("this", "今月", "0"):
+    if keyword == "this":
+        now = datetime.now(JST)
         return (now.year, now.month)
-    match = re.match(r'^-(\d+)$', period_lower)
+    match = _MONTHS_AGO_RE.match(period_lower)
     if match:
         months_ago = int(match.group(1))
-        year, month = now.year, now.month - months_ago
-        while month <= 0:
-            month += 12
-            year -= 1
-        return (year, month)
-    match = re.match(r'^(\d{4})-(\d{2})$', period)
+        now = datetime.now(JST)
+        # 月を通し番号にして一度の divmod で戻す（1年より前になる指定は無効）
+        year, month0 = divmod(now.year * 12 + now.month - 1 - months_ago, 12)
+        if year < 1:
+            return None
+        return (year, month0 + 1)
+    match = _LUNCH_YM_RE.match(period_lower)
     if match:
         return (int(match.group(1)), int(match.group(2)))
     return None
 
 
+@lru_cache(maxsize=256)
 def get_lunch_period_range(year: int, month: int) -> tuple[datetime, datetime]:
-    """指定年月の開始・終了日時をUTCで返す"""
+    """指定年月の開始・終了日時をUTCで返す（年月だけで決まるのでキャッシュする）"""
     start_jst = datetime(year, month, 1, 0, 0, 0, tzinfo=JST)
     if month == 12:
         end_jst = datetime(year + 1, 1, 1, 0, 0, 0, tzinfo=JST)
@@ -1425,12 +2564,9 @@ def get_lunch_period_range(year: int, month: int) -> tuple[datetime, datetime]:
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
 @app_commands.describe(period="集計期間（例: 2024-01, last, -2, all）")
+@require_allowed
 async def lunch_report_command(interaction: discord.Interaction, period: str):
     """ランチ制度レポートコマンド"""
-    if interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
-        return
-
     parsed = parse_lunch_period(period)
     if parsed is None:
         await interaction.response.send_message(
@@ -1462,13 +2598,12 @@ async def lunch_report_command(interaction: discord.Interaction, period: str):
             await interaction.followup.send(f"{period_label}のランチ制度利用データがありません。", ephemeral=True)
             return
 
-        channel_members = [m for m in lunch_channel.members if not m.bot]
-        total_members = len(channel_members)
-        csv_content = generate_lunch_csv(stats, total_members)
+        total_members = count_channel_members(lunch_channel)
+        csv_file = await asyncio.to_thread(generate_lunch_csv, stats, total_members)
 
-        file = discord.File(io.BytesIO(csv_content.encode('utf-8-sig')), filename=filename)
+        file = discord.File(csv_file, filename=filename)
 
-        unique_count = len(stats["unique_participants"])
+        unique_count = len(stats["user_counts"])
         usage_rate = (unique_count / total_members * 100) if total_members > 0 else 0
         summary = (
             f"**ランチ制度 利用状況レポート {period_label}**\n\n"
@@ -1485,9 +2620,244 @@ async def lunch_report_command(interaction: discord.Interaction, period: str):
             await interaction.followup.send("DMを送信できませんでした。DM設定を確認してください。", ephemeral=True)
 
     except Exception as e:
+        # 想定外の不具合も原因を追えるよう、利用者への通知に加えてトレースバックを残す
+        traceback.print_exc()
         await interaction.followup.send(f"エラーが発生しました: {e}", ephemeral=True)
 
 
+# =============================================================================
+# 本気AI: 提出キャッシュ（SQLite）
+# =============================================================================
+# 提出スレッド・チャンネルの投稿ごとの抽出結果（名前・URL）を保持し、
+# レポートのたびに全履歴を読み直したり AI で名前を抽出し直したりしないようにする。
+# 取り込み位置はメッセージインデックスと同じ sync_state に記録する。
+_AI_POSTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_posts (
+    message_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    name TEXT,
+    urls TEXT NOT NULL DEFAULT '',
+    sample TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ai_posts_source_ts ON ai_posts (source, ts);
+"""
+# 後から追加した列（既存のDBには ALTER TABLE で足す）
+_AI_POSTS_ADDED_COLUMNS = {
+    # AIエラーで名前を補えず、問い合わせ直す投稿の本文（先頭500文字。再試行しないなら空）
+    "retry_text": "TEXT NOT NULL DEFAULT ''",
+    "ai_failures": "INTEGER NOT NULL DEFAULT 0",  # AIエラーになった回数
+    "edited_ts": "INTEGER NOT NULL DEFAULT 0",  # 取り込んだ時点の編集時刻（UTCミリ秒、未編集は0）
+}
+
+
+def _migrate_ai_posts(db: sqlite3.Connection) -> None:
+    """ai_posts に足りない列を追加する"""
+    existing = {row[1] for row in db.execute("PRAGMA table_info(ai_posts)")}
+    for column, ddl in _AI_POSTS_ADDED_COLUMNS.items():
+        if column not in existing:
+            db.execute(f"ALTER TABLE ai_posts ADD COLUMN {column} {ddl}")
+    db.commit()
+
+AI_SOURCE_THREAD = "thread"    # 提出スレッド（名前を抽出して集計）
+AI_SOURCE_CHANNEL = "channel"  # 関連チャンネル（ma-ji.ai URLで重複除外して集計）
+
+# 同時に /ai_report が走っても取り込み（と AI 呼び出し）が重複しないように
+_ai_sync_lock = asyncio.Lock()
+# 起動後に直近分の読み直し（停止中の編集・削除の反映）を済ませた取り込み元
+_ai_rescanned: set[str] = set()
+
+
+def _ai_post_fields(
+    source: str,
+    content: str,
+    debug: bool = False
+) -> tuple[str | None, str, str]:
+    """
+    投稿1件から保存する値を作る。
+    名前は正規表現だけで抽出する（取れなかった分のAI問い合わせは呼び出し側でまとめて行い、
+    AIが使えない・エラーのときは「名前なし」と区別して扱う）。
+
+    Returns:
+        (name, urls, sample)
+        name: スレッド投稿から抽出した名前（取れなければ None）
+        urls: チャンネル投稿の ma-ji.ai URL（改行区切り）
+        sample: 名前が取れなかったスレッド投稿の先頭150文字（デバッグ表示用）
+    """
+    if source == AI_SOURCE_THREAD:
+        name = extract_name_regex(content)
+        if debug:
+            print(f"DEBUG regex: '{name}'", flush=True)
+        return name, "", "" if name else content[:150]
+    # ma-ji.ai のURLのみを重複チェック対象にする（本文に含まれなければURL抽出自体を省く）
+    if 'ma-ji.ai' not in content:
+        return None, "", ""
+    maji_urls = sorted(u for u in extract_urls(content) if 'ma-ji.ai' in u)
+    return None, "\n".join(maji_urls), ""
+
+
+async def _sync_ai_source(source: str, channel) -> None:
+    """
+    前回の取り込み位置以降の投稿をキャッシュに取り込む。
+    メッセージインデックスと同じく、起動後の最初の取り込みでは直近 INDEX_RESCAN_DAYS 日分
+    （INDEX_FULL_RESCAN=1 なら全件）を読み直し、停止中の編集・削除を反映する。
+    """
+    row = index_db.execute(
+        "SELECT last_message_id FROM sync_state WHERE channel_id = ?", (channel.id,)
+    ).fetchone()
+    cursor = row[0] if row else 0
+    now_utc = datetime.now(UTC)
+    # 取り込み中に投稿されたメッセージを「削除済み」と誤判定しないための上限
+    sync_started_id = discord.utils.time_snowflake(now_utc, high=True)
+    rescan = row is not None and source not in _ai_rescanned
+    after = discord.Object(id=cursor) if row else None
+    stored = {}  # 読み直す範囲の取り込み済み投稿 -> 取り込んだ時点の編集時刻
+    if rescan:
+        after = None
+        if not INDEX_FULL_RESCAN:
+            rescan_from = discord.utils.time_snowflake(now_utc - timedelta(days=INDEX_RESCAN_DAYS))
+            after = discord.Object(id=min(cursor, rescan_from))
+        stored = dict(index_db.execute(
+            "SELECT message_id, edited_ts FROM ai_posts WHERE source = ? AND message_id > ? AND message_id <= ?",
+            (source, after.id if after else 0, sync_started_id)
+        ))
+
+    # AIエラーで名前を補えなかった投稿を先に問い合わせ直す
+    if source == AI_SOURCE_THREAD:
+        await _retry_ai_names()
+
+    seen_ids = set()
+    count = 0
+    pending = []  # (メッセージ, name, urls, sample)
+    async for message in channel.history(after=after, limit=None, oldest_first=True):
+        cursor = max(cursor, message.id)
+        # 取り込み済みで、その後編集もされていない投稿は抽出し直さない
+        if message.id in stored:
+            seen_ids.add(message.id)
+            if stored[message.id] == _edited_ms(message):
+                continue
+        count += 1
+        # 最初の5件はデバッグログを出力（AI_STATS_DEBUG=1 のときのみ）
+        enable_debug = AI_STATS_DEBUG and count <= 5
+        if enable_debug:
+            print(f"Processing {source} message {count}...", flush=True)
+        pending.append((message, *_ai_post_fields(source, message.content, debug=enable_debug)))
+        if len(pending) >= 100:
+            await _store_ai_posts(source, channel.id, pending, cursor)
+            pending = []
+    if pending:
+        await _store_ai_posts(source, channel.id, pending, cursor)
+
+    # 読み直した範囲で見つからなかった投稿は停止中に削除されたもの
+    if rescan:
+        stale = [(message_id,) for message_id in stored if message_id not in seen_ids]
+        index_db.executemany("DELETE FROM ai_posts WHERE message_id = ?", stale)
+        index_db.execute(
+            "INSERT OR REPLACE INTO sync_state (channel_id, last_message_id) VALUES (?, ?)",
+            (channel.id, cursor)
+        )
+        index_db.commit()
+        print(f"[ai_posts] {source} {channel.id}: removed {len(stale)} deleted messages", flush=True)
+    _ai_rescanned.add(source)
+    print(f"[ai_posts] {source} {channel.id}: synced {count} new messages", flush=True)
+
+
+def _edited_ms(message: discord.Message) -> int:
+    """編集時刻（UTCミリ秒）。未編集なら0"""
+    return _to_ms(message.edited_at) if message.edited_at else 0
+
+
+async def extract_names_batch(contents: list[str]) -> list[str | object | None]:
+    """AI_NAME_BATCH_SIZE 件ずつの問い合わせを AI_NAME_CONCURRENCY 本まで並行して投げる"""
+    chunks = [contents[i:i + AI_NAME_BATCH_SIZE] for i in range(0, len(contents), AI_NAME_BATCH_SIZE)]
+    results = await gather_limited(
+        *(asyncio.to_thread(extract_names_with_ai_batch, chunk) for chunk in chunks),
+        limit=AI_NAME_CONCURRENCY
+    )
+    return [name for names in results for name in names]
+
+
+async def _store_ai_posts(source: str, channel_id: int, pending: list[tuple], cursor: int) -> None:
+    """
+    正規表現で名前が取れなかった投稿をAIでまとめて補ってから保存し、取り込み位置を cursor に進める。
+    AIが使えない・エラーになった投稿は名前なしのまま保存し、本文を残して
+    次回以降の取り込みで問い合わせ直す（_retry_ai_names）。
+    """
+    retry = {}  # pending の位置 -> 問い合わせ直す本文
+    if source == AI_SOURCE_THREAD:
+        unresolved = [i for i, (_, name, _, _) in enumerate(pending) if name is None]
+        if unresolved:
+            names = await extract_names_batch([pending[i][0].content for i in unresolved])
+            for i, name in zip(unresolved, names):
+                if name is AI_NAME_FAILED:
+                    retry[i] = pending[i][0].content[:500]
+                elif name:
+                    pending[i] = (pending[i][0], name, "", "")
+    # AI未初期化（APIキーなし）は投稿ごとの失敗ではないので回数に数えない
+    failures = 1 if ai_model is not None else 0
+    index_db.executemany(
+        "INSERT OR REPLACE INTO ai_posts "
+        "(message_id, source, ts, name, urls, sample, retry_text, ai_failures, edited_ts) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(message.id, source, _to_ms(message.created_at), name, urls, sample,
+          retry.get(i, ""), failures if i in retry else 0, _edited_ms(message))
+         for i, (message, name, urls, sample) in enumerate(pending)]
+    )
+    index_db.execute(
+        "INSERT OR REPLACE INTO sync_state (channel_id, last_message_id) VALUES (?, ?)",
+        (channel_id, cursor)
+    )
+    index_db.commit()
+
+
+async def _retry_ai_names() -> None:
+    """AIエラーで名前を補えなかったスレッド投稿を問い合わせ直す（AI_NAME_MAX_ATTEMPTS 回失敗したら諦める）"""
+    if ai_model is None:
+        return
+    rows = index_db.execute(
+        "SELECT message_id, retry_text, ai_failures FROM ai_posts WHERE retry_text != ''"
+    ).fetchall()
+    if not rows:
+        return
+    names = await extract_names_batch([text for _, text, _ in rows])
+    gave_up = 0
+    for (message_id, text, failures), name in zip(rows, names):
+        if name is AI_NAME_FAILED:
+            failures += 1
+            if failures >= AI_NAME_MAX_ATTEMPTS:
+                text = ""  # 以降は名前なしとして扱う
+                gave_up += 1
+            index_db.execute(
+                "UPDATE ai_posts SET retry_text = ?, ai_failures = ? WHERE message_id = ?",
+                (text, failures, message_id)
+            )
+        else:
+            index_db.execute(
+                "UPDATE ai_posts SET name = ?, sample = CASE WHEN ? IS NULL THEN sample ELSE '' END, "
+                "retry_text = '', ai_failures = 0 WHERE message_id = ?",
+                (name, name, message_id)
+            )
+    index_db.commit()
+    print(f"[ai_posts] retried {len(rows)} names ({gave_up} gave up)", flush=True)
+
+
+# 投稿時刻（UTCミリ秒）から JST の "YYYY-MM" を SQLite 側で作る（JST は夏時間なしの +9時間固定）
+_AI_MONTH_SQL = "strftime('%Y-%m', ts / 1000 + 9 * 3600, 'unixepoch')"
+
+
+def _ai_window_sql(start_utc: datetime | None, end_utc: datetime | None) -> tuple[str, list]:
+    """期間条件（Discord の after/before と同じく両端を含まない）"""
+    where = ""
+    params = []
+    if start_utc:
+        where += " AND ts > ?"
+        params.append(_to_ms(start_utc))
+    if end_utc:
+        where += " AND ts < ?"
+        params.append(_to_ms(end_utc))
+    return where, params
+
+
 # =============================================================================
 # 本気AI: 集計関数
 # =============================================================================
@@ -1498,125 +2868,100 @@ async def collect_ai_stats(
 ) -> dict:
     """本気AI提出の統計を集計する（名前:フィールドベース）。"""
     # スレッドから投稿を取得
-    thread = guild.get_thread(AI_THREAD_ID)
-    if not thread:
-        try:
-            thread = await client.fetch_channel(AI_THREAD_ID)
-        except Exception as e:
-            raise Exception(f"スレッド {AI_THREAD_ID} が見つかりません: {e}")
+    try:
+        thread = await get_or_fetch_channel(guild, AI_THREAD_ID)
+    except Exception as e:
+        raise Exception(f"スレッド {AI_THREAD_ID} が見つかりません: {e}")
 
-    user_counts = defaultdict(int)
-    user_departments = {}
-    unique_participants = set()
-    monthly_counts = defaultdict(int)
+    # チャンネルからも投稿数を取得
+    try:
+        channel = await get_or_fetch_channel(guild, AI_CHANNEL_ID)
+    except:
+        channel = None
+
+    # 前回以降の新着だけを取り込む（過去分はキャッシュから集計）
+    # スレッドとチャンネルは独立しているので並行して取得する
+    # （未来の期間などキャッシュを見るまでもなく空なら取り込みも省く）
+    thread_result, channel_results = None, []
+    if not is_empty_window(start_utc, end_utc):
+        async with _ai_sync_lock:
+            syncs = [_sync_ai_source(AI_SOURCE_THREAD, thread)]
+            if channel:
+                syncs.append(_sync_ai_source(AI_SOURCE_CHANNEL, channel))
+            thread_result, *channel_results = await asyncio.gather(*syncs, return_exceptions=True)
+            index_db.commit()
+
+    if isinstance(thread_result, discord.Forbidden):
+        raise Exception(f"スレッド <#{AI_THREAD_ID}> の履歴を読む権限がありません。")
+    # チャンネルは権限がなければスキップ
+    for result in (thread_result, *channel_results):
+        if isinstance(result, BaseException) and not isinstance(result, discord.Forbidden):
+            raise result
+
+    window_sql, window_params = _ai_window_sql(start_utc, end_utc)
+
+    # ループ内ではリストに積むだけにして、最後に Counter でまとめて数える
+    names = []
+    month_keys = []
+    first_raw_names = {}  # 正規化した名前 -> 最初に出てきた表記（メンバー検索用）
     debug_count = 0
     debug_matched = 0
     debug_unmatched_samples = []  # マッチしなかったメッセージのサンプル
 
-    try:
-        async for message in thread.history(
-            after=start_utc,
-            before=end_utc,
-            limit=None,
-            oldest_first=True
-        ):
-            debug_count += 1
-            content = message.content
-
-            # ハイブリッド方式で名前を抽出（正規表現優先、失敗時のみAI）
-            # 最初の5件はデバッグログを出力
-            enable_debug = debug_count <= 5
-            if enable_debug:
-                print(f"Processing message {debug_count}...", flush=True)
-            name = extract_name_hybrid(content, debug=enable_debug)
-
-            if name:
-                debug_matched += 1
-                raw_name = name
-                # 名前を正規化
-                normalized_name = normalize_name(raw_name)
-
-                # デバッグ: 正規化前後を表示
-                if enable_debug:
-                    print(f"DEBUG: raw='{raw_name}' -> normalized='{normalized_name}'")
-                if normalized_name:
-                    user_counts[normalized_name] += 1
-                    unique_participants.add(normalized_name)
-
-                    # 部署を取得（Discordメンバーから検索）
-                    if normalized_name not in user_departments:
-                        member = find_member_by_name(guild, raw_name)
-                        if member:
-                            depts = extract_departments_list(member.display_name or member.name)
-                            user_departments[normalized_name] = depts
-                        else:
-                            user_departments[normalized_name] = ["不明"]
-
-                    # 月別カウント
-                    month_key = message.created_at.astimezone(JST).strftime("%Y-%m")
-                    monthly_counts[month_key] += 1
-            else:
-                # マッチしなかったメッセージをサンプル保存（最大3件）
-                if len(debug_unmatched_samples) < 3:
-                    debug_unmatched_samples.append(content[:150])
+    rows = index_db.execute(
+        f"SELECT name, {_AI_MONTH_SQL}, sample FROM ai_posts WHERE source = ?{window_sql} ORDER BY message_id",
+        [AI_SOURCE_THREAD, *window_params]
+    )
+    for raw_name, month_key, sample in rows:
+        debug_count += 1
+        if raw_name:
+            debug_matched += 1
+            # 名前を正規化
+            normalized_name = normalize_name(raw_name)
+            if normalized_name:
+                names.append(normalized_name)
+                first_raw_names.setdefault(normalized_name, raw_name)
+                month_keys.append(month_key)
+        else:
+            # マッチしなかったメッセージをサンプル保存（最大3件）
+            if len(debug_unmatched_samples) < 3:
+                debug_unmatched_samples.append(sample)
 
-    except discord.Forbidden:
-        raise Exception(f"スレッド <#{AI_THREAD_ID}> の履歴を読む権限がありません。")
+    user_counts = Counter(names)  # キー一覧がそのままユニーク参加者
+    monthly_counts = Counter(month_keys)
 
-    # チャンネルからも投稿数を取得
-    channel = guild.get_channel(AI_CHANNEL_ID)
-    if not channel:
-        try:
-            channel = await client.fetch_channel(AI_CHANNEL_ID)
-        except:
-            channel = None
+    # 部署を取得（Discordメンバーから検索、参加者ごとに1回。常に1件以上のリスト）
+    member_index = get_member_index(guild)
+    user_departments = {}
+    for normalized_name, raw_name in first_raw_names.items():
+        user_departments[normalized_name] = resolve_departments(guild, raw_name, member_index)
 
-    channel_monthly_counts = defaultdict(int)
+    channel_month_keys = []
     channel_debug_count = 0
-    channel_unique_count = 0
     seen_urls = set()  # 既出URLを追跡
-    if channel:
-        try:
-            async for message in channel.history(
-                after=start_utc,
-                before=end_utc,
-                limit=None,
-                oldest_first=True
-            ):
-                channel_debug_count += 1
-                content = message.content
-
-                # URLを抽出
-                urls = extract_urls(content)
-
-                # ma-ji.ai のURLのみを重複チェック対象にする
-                maji_urls = {u for u in urls if 'ma-ji.ai' in u}
-
-                if maji_urls:
-                    # 新しいURLがあるかチェック
-                    new_urls = maji_urls - seen_urls
-                    if new_urls:
-                        # 新しいURLがある = ユニークな投稿
-                        seen_urls.update(new_urls)
-                        channel_unique_count += 1
-                        month_key = message.created_at.astimezone(JST).strftime("%Y-%m")
-                        channel_monthly_counts[month_key] += 1
-                    # 既出URLのみ = リマインド投稿 → スキップ
-                else:
-                    # URLがない投稿も一応カウント
-                    channel_unique_count += 1
-                    month_key = message.created_at.astimezone(JST).strftime("%Y-%m")
-                    channel_monthly_counts[month_key] += 1
-        except discord.Forbidden:
-            pass
+    rows = index_db.execute(
+        f"SELECT urls, {_AI_MONTH_SQL} FROM ai_posts WHERE source = ?{window_sql} ORDER BY message_id",
+        [AI_SOURCE_CHANNEL, *window_params]
+    )
+    for urls, month_key in rows:
+        channel_debug_count += 1
+        if urls:
+            # 新しいURLがある = ユニークな投稿（既出URLのみ = リマインド投稿 → スキップ）
+            # 一時的な集合を作らず、まとめて追加して件数が増えたかで判定する
+            seen_count = len(seen_urls)
+            seen_urls.update(urls.split("\n"))
+            if len(seen_urls) == seen_count:
+                continue
+        # URLがない投稿も一応カウント
+        channel_month_keys.append(month_key)
 
     return {
-        "user_counts": dict(user_counts),
+        "user_counts": user_counts,
         "user_departments": user_departments,
-        "unique_participants": unique_participants,
-        "monthly_counts": dict(monthly_counts),
-        "channel_monthly_counts": dict(channel_monthly_counts),
-        "total_posts": sum(user_counts.values()),
+        "unique_participants": user_counts.keys(),
+        "monthly_counts": monthly_counts,
+        "channel_monthly_counts": Counter(channel_month_keys),
+        "total_posts": len(names),
         "debug_thread_messages": debug_count,
         "debug_matched": debug_matched,
         "debug_channel_messages": channel_debug_count,
@@ -1624,15 +2969,14 @@ async def collect_ai_stats(
     }
 
 
-def generate_ai_csv(stats: dict, total_members: int) -> str:
-    """本気AI集計結果をCSV形式で出力"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+def generate_ai_csv(stats: dict, total_members: int) -> io.BytesIO:
+    """本気AI集計結果をCSV形式で出力（BytesIO）"""
+    output, writer = _csv_buffer()
 
     unique_count = len(stats["unique_participants"])
     participation_rate = (unique_count / total_members * 100) if total_members > 0 else 0
 
-    sorted_users = sorted(stats["user_counts"].items(), key=lambda x: (-x[1], x[0]))
+    sorted_users = sorted_by_count(stats["user_counts"])
     sorted_months = sorted(stats["monthly_counts"].items())
     sorted_channel_months = sorted(stats["channel_monthly_counts"].items())
 
@@ -1643,8 +2987,12 @@ def generate_ai_csv(stats: dict, total_members: int) -> str:
         ("総投稿数", stats["total_posts"])
     ]
 
-    # 最大行数を計算
-    max_rows = max(len(sorted_users), len(sorted_months), len(sorted_channel_months), len(summary_data))
+    user_departments = stats["user_departments"]
+
+    def user_cells(user) -> tuple:
+        if user is None:
+            return ("", "", "")
+        return user_dept_cells(user, user_departments)
 
     # ヘッダー
     writer.writerow([
@@ -1657,54 +3005,15 @@ def generate_ai_csv(stats: dict, total_members: int) -> str:
         "項目", "値"
     ])
 
-    for i in range(max_rows):
-        row = []
-
-        # セクション1: ユーザー別
-        if i < len(sorted_users):
-            name, count = sorted_users[i]
-            depts = stats["user_departments"].get(name, ["不明"])
-            # 複数部署の場合、名前と部署をセル内改行で表示
-            if isinstance(depts, list) and len(depts) > 1:
-                name_cell = "\n".join([name] * len(depts))
-                dept_cell = "\n".join(depts)
-            else:
-                name_cell = name
-                dept_cell = depts[0] if isinstance(depts, list) else depts
-            row.extend([name_cell, dept_cell, count])
-        else:
-            row.extend(["", "", ""])
-
-        row.append("")
-
-        # セクション2: 月別（スレッド）
-        if i < len(sorted_months):
-            month, count = sorted_months[i]
-            row.extend([month, count])
-        else:
-            row.extend(["", ""])
-
-        row.append("")
-
-        # セクション3: 月別（チャンネル）
-        if i < len(sorted_channel_months):
-            month, count = sorted_channel_months[i]
-            row.extend([month, count])
-        else:
-            row.extend(["", ""])
-
-        row.append("")
-
-        # セクション4: サマリー
-        if i < len(summary_data):
-            item, value = summary_data[i]
-            row.extend([item, value])
-        else:
-            row.extend(["", ""])
-
-        writer.writerow(row)
+    # 4つの表（ユーザー別・月別スレッド・月別チャンネル・サマリー）を横に並べる
+    writer.writerows(
+        user_cells(user) + ("",) + (month or ("", "")) + ("",)
+        + (channel_month or ("", "")) + ("",) + (summary or ("", ""))
+        for user, month, channel_month, summary
+        in zip_longest(sorted_users, sorted_months, sorted_channel_months, summary_data)
+    )
 
-    return output.getvalue()
+    return _finish_csv(output)
 
 
 # =============================================================================
@@ -1716,12 +3025,9 @@ def generate_ai_csv(stats: dict, total_members: int) -> str:
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
 @app_commands.describe(period="集計期間（例: 2024-01, last, -2, all）")
+@require_allowed
 async def ai_report_command(interaction: discord.Interaction, period: str):
     """本気AIレポートコマンド"""
-    if interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
-        return
-
     parsed = parse_lunch_period(period)
     if parsed is None:
         await interaction.response.send_message(
@@ -1769,10 +3075,10 @@ async def ai_report_command(interaction: discord.Interaction, period: str):
             return
 
         # 全体メンバー数（Bot除外）
-        total_members = sum(1 for m in guild.members if not m.bot)
-        csv_content = generate_ai_csv(stats, total_members)
+        total_members = len(get_members_cached(guild))
+        csv_file = await asyncio.to_thread(generate_ai_csv, stats, total_members)
 
-        file = discord.File(io.BytesIO(csv_content.encode('utf-8-sig')), filename=filename)
+        file = discord.File(csv_file, filename=filename)
 
         unique_count = len(stats["unique_participants"])
         participation_rate = (unique_count / total_members * 100) if total_members > 0 else 0
@@ -1791,6 +3097,8 @@ async def ai_report_command(interaction: discord.Interaction, period: str):
             await interaction.followup.send("DMを送信できませんでした。DM設定を確認してください。", ephemeral=True)
 
     except Exception as e:
+        # 想定外の不具合も原因を追えるよう、利用者への通知に加えてトレースバックを残す
+        traceback.print_exc()
         await interaction.followup.send(f"エラーが発生しました: {e}", ephemeral=True)
 
 
@@ -1802,51 +3110,31 @@ async def ai_report_command(interaction: discord.Interaction, period: str):
     description="設定されているチャンネル/スレッドの情報を表示",
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
+@require_allowed
 async def channel_info_command(interaction: discord.Interaction):
     """チャンネル情報表示コマンド"""
-    if interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
-        return
-
     await interaction.response.defer(ephemeral=True)
 
     info_lines = ["**設定されているチャンネル/スレッド情報**\n"]
 
-    # レベッターチャンネル
-    for ch_id in CHANNEL_IDS:
-        try:
-            ch = await client.fetch_channel(ch_id)
-            info_lines.append(f"📢 レベッター: **{ch.name}** (ID: {ch_id})")
-        except:
-            info_lines.append(f"❌ レベッター: 取得失敗 (ID: {ch_id})")
-
-    # ランチ制度スレッド
-    try:
-        ch = await client.fetch_channel(LUNCH_THREAD_ID)
-        info_lines.append(f"🍽️ ランチ制度スレッド: **{ch.name}** (ID: {LUNCH_THREAD_ID})")
-    except:
-        info_lines.append(f"❌ ランチ制度スレッド: 取得失敗 (ID: {LUNCH_THREAD_ID})")
-
-    # ランチ制度チャンネル
-    try:
-        ch = await client.fetch_channel(LUNCH_CHANNEL_ID)
-        info_lines.append(f"🍽️ ランチ制度チャンネル: **{ch.name}** (ID: {LUNCH_CHANNEL_ID})")
-    except:
-        info_lines.append(f"❌ ランチ制度チャンネル: 取得失敗 (ID: {LUNCH_CHANNEL_ID})")
-
-    # 本気AIスレッド
-    try:
-        ch = await client.fetch_channel(AI_THREAD_ID)
-        info_lines.append(f"🤖 本気AIスレッド: **{ch.name}** (ID: {AI_THREAD_ID})")
-    except:
-        info_lines.append(f"❌ 本気AIスレッド: 取得失敗 (ID: {AI_THREAD_ID})")
+    targets = [("📢", "レベッター", ch_id) for ch_id in CHANNEL_IDS]
+    targets += [
+        ("🍽️", "ランチ制度スレッド", LUNCH_THREAD_ID),
+        ("🍽️", "ランチ制度チャンネル", LUNCH_CHANNEL_ID),
+        ("🤖", "本気AIスレッド", AI_THREAD_ID),
+        ("🤖", "本気AIチャンネル", AI_CHANNEL_ID),
+    ]
 
-    # 本気AIチャンネル
-    try:
-        ch = await client.fetch_channel(AI_CHANNEL_ID)
-        info_lines.append(f"🤖 本気AIチャンネル: **{ch.name}** (ID: {AI_CHANNEL_ID})")
-    except:
-        info_lines.append(f"❌ 本気AIチャンネル: 取得失敗 (ID: {AI_CHANNEL_ID})")
+    # ギルドキャッシュにあるものは HTTP を使わず、残りをまとめて並行取得（失敗したものは例外が入る）
+    channels = await asyncio.gather(
+        *(get_or_fetch_channel(interaction.guild, ch_id) for _, _, ch_id in targets),
+        return_exceptions=True
+    )
+    for (icon, label, ch_id), ch in zip(targets, channels):
+        if isinstance(ch, BaseException):
+            info_lines.append(f"❌ {label}: 取得失敗 (ID: {ch_id})")
+        else:
+            info_lines.append(f"{icon} {label}: **{ch.name}** (ID: {ch_id})")
 
     await interaction.followup.send("\n".join(info_lines), ephemeral=True)
 
@@ -1860,12 +3148,9 @@ async def channel_info_command(interaction: discord.Interaction):
     guild=discord.Object(id=GUILD_ID) if GUILD_ID else None
 )
 @app_commands.describe(period="集計期間（例: 2024-01, last, -2, all）")
+@require_allowed
 async def like_stats_command(interaction: discord.Interaction, period: str):
     """いいねした回数レポートコマンド"""
-    if interaction.user.id not in ALLOWED_USER_IDS:
-        await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
-        return
-
     parsed = parse_lunch_period(period)
     if parsed is None:
         await interaction.response.send_message(
@@ -1900,30 +3185,27 @@ async def like_stats_command(interaction: discord.Interaction, period: str):
             return
 
         # いいねした回数でソート
-        sorted_by_likes = sorted(
-            [(uid, data) for uid, data in user_stats.items() if data.get("likes_given", 0) > 0],
-            key=lambda x: -x[1].get("likes_given", 0)
-        )
+        likes_by_user = {
+            uid: data["likes_given"] for uid, data in user_stats.items() if data.get("likes_given", 0) > 0
+        }
+        sorted_by_likes = [(uid, user_stats[uid]) for uid in keys_by_value_desc(likes_by_user)]
 
-        # 部署別集計を計算
+        # 部署別集計を計算（名前の分解結果は個人別の行でも使うので残しておく）
         dept_stats = defaultdict(lambda: {"posts": 0, "hearts": 0, "likes_given": 0})
+        name_parts = {}
         for uid, data in user_stats.items():
-            dept, _ = extract_department(data["name"])
-            if not dept:
-                dept = "不明"
-            dept_stats[dept]["posts"] += data.get("posts", 0)
-            dept_stats[dept]["hearts"] += data.get("hearts", 0)
-            dept_stats[dept]["likes_given"] += data.get("likes_given", 0)
+            dept, _ = name_parts[uid] = extract_department(data["name"])
+            totals = dept_stats[dept or "不明"]
+            totals["posts"] += data.get("posts", 0)
+            totals["hearts"] += data.get("hearts", 0)
+            totals["likes_given"] += data.get("likes_given", 0)
 
         # 部署別を投稿数でソート
-        sorted_depts = sorted(dept_stats.items(), key=lambda x: -x[1]["posts"])
+        posts_by_dept = {dept: totals["posts"] for dept, totals in dept_stats.items()}
+        sorted_depts = [(dept, dept_stats[dept]) for dept in keys_by_value_desc(posts_by_dept)]
 
         # CSV生成
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # 個人別、部署別、トップ投稿を横並びで表示
-        max_rows = max(len(sorted_by_likes), len(sorted_depts), len(top_posts))
+        output, writer = _csv_buffer()
 
         writer.writerow([
             "部署", "名前", "いいねした回数", "いいねもらった数", "投稿数",
@@ -1936,45 +3218,40 @@ async def like_stats_command(interaction: discord.Interaction, period: str):
         total_likes_given = 0
         total_hearts = 0
         total_posts = 0
-        for i in range(max_rows):
-            row = []
-
-            # 個人別
-            if i < len(sorted_by_likes):
-                uid, data = sorted_by_likes[i]
-                dept, name_only = extract_department(data["name"])
-                likes_given = data.get("likes_given", 0)
-                total_likes_given += likes_given
-                total_hearts += data["hearts"]
-                total_posts += data["posts"]
-                row.extend([dept, name_only, likes_given, data["hearts"], data["posts"]])
-            else:
-                row.extend(["", "", "", "", ""])
-
-            row.append("")  # 区切り
+        for _, data in sorted_by_likes:
+            total_likes_given += data.get("likes_given", 0)
+            total_hearts += data["hearts"]
+            total_posts += data["posts"]
+
+        def user_cells(item) -> tuple:
+            if item is None:
+                return ("", "", "", "", "")
+            uid, data = item
+            dept, name_only = name_parts[uid]
+            return (dept, name_only, data.get("likes_given", 0), data["hearts"], data["posts"])
+
+        def dept_cells(item) -> tuple:
+            if item is None:
+                return ("", "", "")
+            dept_name, dept_data = item
+            return (dept_name, dept_data["posts"], dept_data["hearts"])
+
+        def post_cells(item) -> tuple:
+            if item is None:
+                return ("", "", "", "", "")
+            rank, post = item
+            _, author_name = extract_department(post["author"])
+            # 投稿内容は最初の100文字まで
+            content_preview = post["content"][:100].replace("\n", " ")
+            if len(post["content"]) > 100:
+                content_preview += "..."
+            return (rank, author_name, post["hearts"], post["date"], content_preview)
 
-            # 部署別
-            if i < len(sorted_depts):
-                dept_name, dept_data = sorted_depts[i]
-                row.extend([dept_name, dept_data["posts"], dept_data["hearts"]])
-            else:
-                row.extend(["", "", ""])
-
-            row.append("")  # 区切り
-
-            # トップ投稿
-            if i < len(top_posts):
-                post = top_posts[i]
-                _, author_name = extract_department(post["author"])
-                # 投稿内容は最初の100文字まで
-                content_preview = post["content"][:100].replace("\n", " ")
-                if len(post["content"]) > 100:
-                    content_preview += "..."
-                row.extend([i + 1, author_name, post["hearts"], post["date"], content_preview])
-            else:
-                row.extend(["", "", "", "", ""])
-
-            writer.writerow(row)
+        # 個人別、部署別、トップ投稿を横並びで表示
+        writer.writerows(
+            user_cells(user) + ("",) + dept_cells(dept) + ("",) + post_cells(post)
+            for user, dept, post in zip_longest(sorted_by_likes, sorted_depts, enumerate(top_posts, 1))
+        )
 
         # 合計行
         writer.writerow([
@@ -1983,8 +3260,7 @@ async def like_stats_command(interaction: discord.Interaction, period: str):
             "", "", "", "", ""
         ])
 
-        csv_content = output.getvalue()
-        file = discord.File(io.BytesIO(csv_content.encode('utf-8-sig')), filename=filename)
+        file = discord.File(_finish_csv(output), filename=filename)
 
         summary = (
             f"**いいねした回数レポート {period_label}**\n\n"
@@ -1999,26 +3275,75 @@ async def like_stats_command(interaction: discord.Interaction, period: str):
             await interaction.followup.send("DMを送信できませんでした。DM設定を確認してください。", ephemeral=True)
 
     except Exception as e:
+        # 想定外の不具合も原因を追えるよう、利用者への通知に加えてトレースバックを残す
+        traceback.print_exc()
         await interaction.followup.send(f"エラーが発生しました: {e}", ephemeral=True)
 
 
 # =============================================================================
 # イベント: Bot起動時
 # =============================================================================
+def command_tree_digest(guild: discord.abc.Snowflake | None) -> str:
+    """同期対象のコマンド定義（送信される内容）から作るハッシュ"""
+    payload = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)),
+        key=lambda d: (d.get("type", 1), d["name"])
+    )
+    return hashlib.sha256(
+        json.dumps([GUILD_ID, payload], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+async def sync_commands_if_changed(guild: discord.abc.Snowflake | None) -> bool:
+    """
+    前回同期したときとコマンド定義が変わっていれば同期する（再接続のたびに同期しない）。
+    同期したら True を返す。
+    """
+    digest = command_tree_digest(guild)
+    if os.environ.get("FORCE_SYNC") != "1":
+        try:
+            with open(COMMAND_SYNC_HASH_PATH, encoding="utf-8") as f:
+                if f.read().strip() == digest:
+                    return False
+        except OSError:
+            pass
+    await tree.sync(guild=guild)
+    try:
+        with open(COMMAND_SYNC_HASH_PATH, "w", encoding="utf-8") as f:
+            f.write(digest)
+    except OSError as e:
+        print(f"Failed to save command sync hash: {e}", flush=True)
+    return True
+
+
 @client.event
 async def on_ready():
     """Bot起動時の処理"""
+    global _index_sync_task
     print(f"Logged in as {client.user}")
 
-    # スラッシュコマンドを同期
+    # スラッシュコマンドを同期（定義が前回と同じなら省略）
     if GUILD_ID:
         guild = discord.Object(id=GUILD_ID)
         tree.copy_global_to(guild=guild)
-        await tree.sync(guild=guild)
-        print(f"Commands synced to guild {GUILD_ID}")
+        if await sync_commands_if_changed(guild):
+            print(f"Commands synced to guild {GUILD_ID}")
+        else:
+            print("Commands unchanged; skipped sync")
     else:
-        await tree.sync()
-        print("Commands synced globally")
+        if await sync_commands_if_changed(None):
+            print("Commands synced globally")
+        else:
+            print("Commands unchanged; skipped sync")
+
+    # メッセージインデックスの取り込み（再接続時に重複起動しない）
+    guild = client.get_guild(GUILD_ID) if GUILD_ID else None
+    if guild and (_index_sync_task is None or _index_sync_task.done()):
+        _index_sync_task = asyncio.create_task(sync_message_index(guild))
+
+    # メンバー一覧と名前検索用の索引を先に作っておく（以降はメンバーイベントで作り直す）
+    if guild:
+        get_member_index(guild)
 
     print("Bot is ready!")
 
@@ -2043,6 +3368,9 @@ if __name__ == "__main__":
         print("Error: GEMINI_API_KEY 環境変数が設定されていません。")
         exit(1)
 
+    # インデックスDBを開く（INDEX_DB_PATH。永続ディスク上に置かないと再起動ごとに全履歴を取り込み直す）
+    index_db = open_index_db()
+
     # Gemini初期化（グローバル変数ai_modelを更新）
     ai_model = init_gemini()
     if ai_model:
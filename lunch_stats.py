@@ -5,12 +5,20 @@ Discord ランチ制度利用状況 集計スクリプト
 """
 
 import os
+import asyncio
+import codecs
 import csv
+import hashlib
 import io
+import json
 import re
+import time
+import traceback
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from collections import defaultdict
+from collections import Counter
+from functools import lru_cache
+from itertools import islice, zip_longest
 
 import discord
 from discord import app_commands
@@ -21,8 +29,13 @@ from discord import app_commands
 # =============================================================================
 GUILD_ID = 1172020927047942154
 LUNCH_CHANNEL_ID = 1437763696096182363  # ランチ制度フォーム投稿チャンネル
-ALLOWED_USER_IDS = [1340666940615823451, 1307922048731058247]
+ALLOWED_USER_IDS: frozenset[int] = frozenset({1340666940615823451, 1307922048731058247})
 EXCLUDE_BOTS = True
+PARSE_BATCH_SIZE = 200  # 何件ずつまとめて別スレッドでフォームをパースするか
+CHANNEL_MEMBER_COUNT_TTL = 300  # チャンネルメンバー数（Bot除く）を数え直すまでの秒数
+
+# スラッシュコマンド定義のハッシュ保存先（定義が変わったときだけ同期する。FORCE_SYNC=1 で常に同期）
+COMMAND_SYNC_HASH_PATH = os.environ.get("COMMAND_SYNC_HASH_PATH", ".lunch_commands_sync_hash")
 
 # タイムゾーン
 JST = ZoneInfo("Asia/Tokyo")
@@ -43,13 +56,19 @@ tree = app_commands.CommandTree(client)
 # =============================================================================
 # 部署抽出
 # =============================================================================
+_BRACKET_RE = re.compile(r'【(.+?)】')        # 【部署】
+_BRACKET_SUB_RE = re.compile(r'【.+?】')       # 【部署】（除去用）
+_PAREN_FULL_RE = re.compile(r'（.+?）$')       # 末尾の（ニックネーム）
+_PAREN_HALF_RE = re.compile(r'\(.+?\)$')      # 末尾の(ニックネーム)
+
+
 def extract_department_from_nickname(nickname: str) -> str | None:
     """
     ニックネームから部署を抽出する。
     形式: 【部署名】名前（ニックネーム）
     例: 【社長室】與儀 あんり（あんり） → "社長室"
     """
-    match = re.match(r'【(.+?)】', nickname)
+    match = _BRACKET_RE.match(nickname)
     return match.group(1) if match else None
 
 
@@ -60,36 +79,56 @@ def extract_name_from_nickname(nickname: str) -> str:
     例: 【社長室】與儀 あんり（あんり） → "與儀 あんり"
     """
     # 【部署】を除去
-    name = re.sub(r'【.+?】', '', nickname).strip()
+    name = _BRACKET_SUB_RE.sub('', nickname).strip()
     # （ニックネーム）を除去
-    name = re.sub(r'（.+?）$', '', name).strip()
-    name = re.sub(r'\(.+?\)$', '', name).strip()
+    name = _PAREN_FULL_RE.sub('', name).strip()
+    name = _PAREN_HALF_RE.sub('', name).strip()
     return name
 
 
-def find_member_by_name(guild: discord.Guild, form_name: str) -> discord.Member | None:
+def build_member_index(guild: discord.Guild) -> dict:
     """
-    フォームの名前からDiscordメンバーを検索する。
-    """
-    form_name_normalized = form_name.strip()
+    find_member_by_name 用の索引を作る（集計1回につき1度だけ作る）。
 
+    Returns:
+        {
+            "exact": {ニックネームから抽出した名前: (entries の位置, メンバー)},  # 最初のメンバーのみ
+            "entries": [(表示名, メンバー), ...]                                # guild.members の順（Bot除く）
+        }
+    """
+    exact = {}
+    entries = []
     for member in guild.members:
         if member.bot:
             continue
-
-        # ニックネームから名前を抽出して比較
         display = member.display_name or member.name
-        extracted_name = extract_name_from_nickname(display)
+        exact.setdefault(extract_name_from_nickname(display), (len(entries), member))
+        entries.append((display, member))
+    return {"exact": exact, "entries": entries}
 
-        # 完全一致
-        if extracted_name == form_name_normalized:
-            return member
 
-        # 部分一致（名前がニックネームに含まれる）
+def find_member_by_name(
+    guild: discord.Guild,
+    form_name: str,
+    member_index: dict | None = None
+) -> discord.Member | None:
+    """
+    フォームの名前からDiscordメンバーを検索する。
+    メンバー順で最初に「抽出した名前が完全一致」または「表示名に部分一致」したメンバーを返す。
+    """
+    index = member_index if member_index is not None else build_member_index(guild)
+    form_name_normalized = form_name.strip()
+
+    # 完全一致は索引で引く
+    exact = index["exact"].get(form_name_normalized)
+    limit = exact[0] if exact else len(index["entries"])
+
+    # それより前に部分一致（名前がニックネームに含まれる）するメンバーがいればそちらを優先
+    for display, member in islice(index["entries"], limit):
         if form_name_normalized in display:
             return member
 
-    return None
+    return exact[1] if exact else None
 
 
 def get_member_department(member: discord.Member) -> str:
@@ -99,9 +138,50 @@ def get_member_department(member: discord.Member) -> str:
     return dept if dept else "不明"
 
 
+# チャンネルID -> (数えたときのサーバー人数, 数えた時刻, Botを除くチャンネルメンバー数)
+# 参加・退出でサーバー人数が変われば数え直す。権限変更は TTL で拾う。
+_channel_member_counts: dict[int, tuple[int | None, float, int]] = {}
+
+
+def count_channel_members(channel: discord.TextChannel) -> int:
+    """チャンネルを閲覧できるメンバー数（Bot除く）。一覧は作らずに数える"""
+    member_count = channel.guild.member_count
+    cached = _channel_member_counts.get(channel.id)
+    if (
+        cached is not None
+        and cached[0] == member_count
+        and time.monotonic() - cached[1] < CHANNEL_MEMBER_COUNT_TTL
+    ):
+        return cached[2]
+    count = sum(1 for m in channel.members if not m.bot)
+    _channel_member_counts[channel.id] = (member_count, time.monotonic(), count)
+    return count
+
+
 # =============================================================================
 # フォームパーサー
 # =============================================================================
+FORM_FIELDS = (
+    "代表者名", "代表者の所属部署", "ランチ実施日", "参加人数",
+    "参加メンバー", "合計金額（税込）", "ランチ会議の感想をひとこと",
+)
+# フォームの既知の見出し「【項目名】\n」だけで区切る
+# （「【営業】田中 太郎」のような【】始まりの値を見出しと誤認しないため）
+_HEADER_RE = re.compile(
+    r'【(' + '|'.join(map(re.escape, FORM_FIELDS)) + r')】\s*\n'
+)
+_LEADING_INT_RE = re.compile(r'\d+')
+
+
+def _split_fields(content: str) -> dict[str, str]:
+    """フォーム本文を1回の走査で {項目名: 値} に分割する（同名項目は先勝ち）"""
+    parts = _HEADER_RE.split(content)
+    fields = {}
+    for name, value in zip(parts[1::2], parts[2::2]):
+        fields.setdefault(name, value)
+    return fields
+
+
 def parse_lunch_form(content: str) -> dict | None:
     """
     フォーム投稿からランチ制度データを抽出する。
@@ -123,40 +203,26 @@ def parse_lunch_form(content: str) -> dict | None:
         return None
 
     try:
-        result = {}
-
-        # 代表者名
-        match = re.search(r'【代表者名】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["representative"] = match.group(1).strip() if match else ""
-
-        # 所属部署
-        match = re.search(r'【代表者の所属部署】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["department"] = match.group(1).strip() if match else ""
-
-        # 実施日
-        match = re.search(r'【ランチ実施日】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["date"] = match.group(1).strip() if match else ""
-
-        # 参加人数
-        match = re.search(r'【参加人数】\s*\n(\d+)', content)
-        result["participant_count"] = int(match.group(1)) if match else 0
-
-        # 参加メンバー（複数行）
-        match = re.search(r'【参加メンバー】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        if match:
-            members_text = match.group(1).strip()
-            # 改行で分割し、空行を除外
-            result["participants"] = [m.strip() for m in members_text.split('\n') if m.strip()]
-        else:
-            result["participants"] = []
-
-        # 合計金額
-        match = re.search(r'【合計金額（税込）】\s*\n(\d+)', content)
-        result["total_amount"] = int(match.group(1)) if match else 0
-
-        # 感想
-        match = re.search(r'【ランチ会議の感想をひとこと】\s*\n(.+?)(?=\n【|$)', content, re.DOTALL)
-        result["comment"] = match.group(1).strip() if match else ""
+        # 項目ごとに正規表現で本文を走査し直さず、1回の split で全項目を取り出す
+        fields = _split_fields(content)
+
+        def text(name: str) -> str:
+            return fields.get(name, "").strip()
+
+        def number(name: str) -> int:
+            match = _LEADING_INT_RE.match(fields.get(name, ""))
+            return int(match.group(0)) if match else 0
+
+        result = {
+            "representative": text("代表者名"),
+            "department": text("代表者の所属部署"),
+            "date": text("ランチ実施日"),
+            "participant_count": number("参加人数"),
+            # 参加メンバー（複数行）。改行で分割し、空行を除外
+            "participants": [m.strip() for m in text("参加メンバー").split('\n') if m.strip()],
+            "total_amount": number("合計金額（税込）"),
+            "comment": text("ランチ会議の感想をひとこと")
+        }
 
         # 必須項目のチェック
         if not result["representative"] or not result["participants"]:
@@ -171,6 +237,23 @@ def parse_lunch_form(content: str) -> dict | None:
 # =============================================================================
 # 集計関数
 # =============================================================================
+def _parse_batch(batch: list[tuple]) -> list[dict]:
+    """
+    (メッセージID, 投稿日時, 本文) のまとまりをフォームとしてパースする（別スレッドで実行）。
+    パースできなかった投稿は含めない。
+    """
+    records = []
+    for message_id, posted_at, content in batch:
+        parsed = parse_lunch_form(content)
+        if parsed:
+            records.append({
+                **parsed,
+                "message_id": message_id,
+                "posted_at": posted_at
+            })
+    return records
+
+
 async def collect_lunch_stats(
     guild: discord.Guild,
     start_utc: datetime | None = None,
@@ -181,13 +264,12 @@ async def collect_lunch_stats(
 
     Returns:
         {
-            "records": list[dict],           # 各フォームのパース結果リスト
             "user_counts": dict[str, int],   # ユーザー別参加回数
             "user_departments": dict[str, str], # ユーザー別部署
             "dept_counts": dict[str, int],   # 部署別参加回数
             "total_events": int,             # 総イベント数
             "total_participants": int,       # 延べ参加人数
-            "unique_participants": set,      # ユニーク参加者
+            "unique_participants": dict_keys, # ユニーク参加者（user_counts のキー）
             "total_amount": int              # 総金額
         }
     """
@@ -195,13 +277,23 @@ async def collect_lunch_stats(
     if not channel or not isinstance(channel, discord.TextChannel):
         raise Exception(f"チャンネル {LUNCH_CHANNEL_ID} が見つかりません。")
 
-    records = []
-    user_counts = defaultdict(int)
-    user_departments = {}  # 名前 → 部署
-    dept_counts = defaultdict(int)  # 部署 → 回数
+    # パース結果は保持せず、届いた順に集計値だけ更新する（メモリは参加者数に比例）
+    user_counts = Counter()
+    total_events = 0
     total_amount = 0
-    unique_participants = set()
 
+    async def add_batch(batch: list[tuple]) -> None:
+        nonlocal total_events, total_amount
+        # フォームをパース（正規表現の処理でイベントループを塞がないよう別スレッドで）
+        for record in await asyncio.to_thread(_parse_batch, batch):
+            total_events += 1
+
+            # 参加者カウント（部署は最後にまとめて取得）
+            user_counts.update(record["participants"])
+
+            total_amount += record["total_amount"]
+
+    batch = []
     try:
         async for message in channel.history(
             after=start_utc,
@@ -213,59 +305,70 @@ async def collect_lunch_stats(
             if EXCLUDE_BOTS and message.author.bot:
                 continue
 
-            # フォームをパース
-            parsed = parse_lunch_form(message.content)
-            if not parsed:
+            content = message.content
+            # フォーム以外の投稿はパース側へ送らない（parse_lunch_form と同じ判定）
+            if '【代表者名】' not in content:
                 continue
+            batch.append((message.id, message.created_at, content))
+            if len(batch) >= PARSE_BATCH_SIZE:
+                await add_batch(batch)
+                batch = []
 
-            records.append({
-                **parsed,
-                "message_id": message.id,
-                "posted_at": message.created_at
-            })
-
-            # 参加者カウント & 部署取得
-            for participant in parsed["participants"]:
-                user_counts[participant] += 1
-                unique_participants.add(participant)
-
-                # 部署を取得（まだ取得していない場合）
-                if participant not in user_departments:
-                    member = find_member_by_name(guild, participant)
-                    if member:
-                        dept = get_member_department(member)
-                        user_departments[participant] = dept
-                    else:
-                        user_departments[participant] = "不明"
+    except discord.Forbidden:
+        raise Exception(f"チャンネル <#{LUNCH_CHANNEL_ID}> の履歴を読む権限がありません。")
 
-                # 部署別カウント
-                dept = user_departments.get(participant, "不明")
-                dept_counts[dept] += 1
+    if batch:
+        await add_batch(batch)
 
-            total_amount += parsed["total_amount"]
+    # 部署を取得（参加者ごとに1回だけ、メンバー索引も1回だけ作る）
+    member_index = build_member_index(guild)
+    user_departments = {}  # 名前 → 部署
+    for participant in user_counts:
+        member = find_member_by_name(guild, participant, member_index)
+        user_departments[participant] = get_member_department(member) if member else "不明"
 
-    except discord.Forbidden:
-        raise Exception(f"チャンネル <#{LUNCH_CHANNEL_ID}> の履歴を読む権限がありません。")
+    # 部署別カウント（参加回数をまとめて加算）
+    dept_counts = Counter()  # 部署 → 回数
+    for participant, count in user_counts.items():
+        dept_counts[user_departments[participant]] += count
 
     return {
-        "records": records,
         "user_departments": user_departments,
         "dept_counts": dict(dept_counts),
-        "user_counts": dict(user_counts),
-        "total_events": len(records),
-        "total_participants": sum(len(r["participants"]) for r in records),
-        "unique_participants": unique_participants,
+        "user_counts": user_counts,
+        "total_events": total_events,
+        "total_participants": sum(user_counts.values()),
+        "unique_participants": user_counts.keys(),  # 参加回数の集計キーがそのままユニーク参加者
         "total_amount": total_amount
     }
 
 
-def generate_lunch_csv(stats: dict, total_members: int) -> str:
-    """集計結果をCSV形式で出力"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+def _csv_buffer() -> tuple:
+    """
+    BOM付き UTF-8 の CSV を書き込む (テキストストリーム, csv.writer) を返す。
+    BytesIO に直接書き込み（StringIO → encode → BytesIO のコピーを避ける）、
+    BOM は先に書いて本文は C 実装の utf-8 エンコーダーで書く。書き終えたら _finish_csv に渡す。
+    """
+    buf = io.BytesIO()
+    buf.write(codecs.BOM_UTF8)
+    output = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    return output, csv.writer(output)
+
+
+def _finish_csv(output: io.TextIOWrapper) -> io.BytesIO:
+    """書き込みを終え、先頭に巻き戻した BytesIO を返す"""
+    output.flush()
+    buf = output.detach()
+    buf.seek(0)
+    return buf
+
+
+def generate_lunch_csv(stats: dict, total_members: int) -> io.BytesIO:
+    """集計結果をCSVファイル（BytesIO）として出力"""
+    output, writer = _csv_buffer()
 
     # サマリー計算
-    unique_count = len(stats["unique_participants"])
+    unique_count = len(stats["user_counts"])
     usage_rate = (unique_count / total_members * 100) if total_members > 0 else 0
 
     # データ準備
@@ -279,8 +382,7 @@ def generate_lunch_csv(stats: dict, total_members: int) -> str:
         ("利用率", f"{usage_rate:.1f}%")
     ]
 
-    # 最大行数を計算
-    max_rows = max(len(sorted_users), len(sorted_depts), len(summary_data))
+    user_departments = stats["user_departments"]
 
     # ヘッダー
     writer.writerow([
@@ -291,46 +393,27 @@ def generate_lunch_csv(stats: dict, total_members: int) -> str:
         "項目", "値"
     ])
 
-    # データ行
-    for i in range(max_rows):
-        row = []
+    def user_cells(user) -> tuple:
+        if user is None:
+            return ("", "", "")
+        name, count = user
+        return (name, user_departments.get(name, "不明"), count)
 
-        # セクション1: ユーザー別
-        if i < len(sorted_users):
-            name, count = sorted_users[i]
-            dept = stats["user_departments"].get(name, "不明")
-            row.extend([name, dept, count])
-        else:
-            row.extend(["", "", ""])
-
-        row.append("")  # 区切り
-
-        # セクション2: 部署別
-        if i < len(sorted_depts):
-            dept_name, dept_count = sorted_depts[i]
-            row.extend([dept_name, dept_count])
-        else:
-            row.extend(["", ""])
-
-        row.append("")  # 区切り
+    # データ行（ユーザー別・部署別・サマリーを横に並べ、短い表は空欄で埋める）
+    writer.writerows(
+        user_cells(user) + ("",) + (dept or ("", "")) + ("",) + (summary or ("", ""))
+        for user, dept, summary in zip_longest(sorted_users, sorted_depts, summary_data)
+    )
 
-        # セクション3: サマリー（縦並び）
-        if i < len(summary_data):
-            item, value = summary_data[i]
-            row.extend([item, value])
-        else:
-            row.extend(["", ""])
-
-        writer.writerow(row)
-
-    return output.getvalue()
+    return _finish_csv(output)
 
 
 # =============================================================================
 # 期間計算
 # =============================================================================
+@lru_cache(maxsize=256)
 def get_period_range(year: int, month: int) -> tuple[datetime, datetime]:
-    """指定年月の開始・終了日時をUTCで返す"""
+    """指定年月の開始・終了日時をUTCで返す（年月だけで決まるのでキャッシュする）"""
     start_jst = datetime(year, month, 1, 0, 0, 0, tzinfo=JST)
 
     if month == 12:
@@ -344,6 +427,19 @@ def get_period_range(year: int, month: int) -> tuple[datetime, datetime]:
 # =============================================================================
 # スラッシュコマンド
 # =============================================================================
+_MONTHS_AGO_RE = re.compile(r'^-(\d+)$')
+_YM_RE = re.compile(r'^(\d{4})-(\d{2})$')
+# 全角の空白・マイナス記号（長音記号も含む）を半角にそろえる
+_PERIOD_TRANSLATE = str.maketrans({"\u3000": " ", "－": "-", "−": "-", "ー": "-"})
+
+# 期間のキーワード → 種別（1回の dict 引きで判定する）
+_PERIOD_KEYWORDS = {
+    "all": "all", "全期間": "all",
+    "last": "last", "先月": "last", "-1": "last",
+    "this": "this", "今月": "this", "0": "this",
+}
+
+
 def parse_period(period: str) -> tuple[int, int] | str | None:
     """
     期間文字列をパースして (year, month) または "all" を返す。
@@ -354,37 +450,40 @@ def parse_period(period: str) -> tuple[int, int] | str | None:
       - "-1", "-2", "-3" → N ヶ月前
       - "all", "全期間" → 全期間
     """
-    period_lower = period.lower().strip()
-    now = datetime.now(JST)
+    period_lower = period.translate(_PERIOD_TRANSLATE).strip().lower()
+    # 現在時刻は相対指定（先月・今月・N ヶ月前）のときだけ取得する
+    keyword = _PERIOD_KEYWORDS.get(period_lower)
 
     # 全期間
-    if period_lower in ("all", "全期間"):
+    if keyword == "all":
         return "all"
 
     # 先月
-    if period_lower in ("last", "先月", "-1"):
+    if keyword == "last":
+        now = datetime.now(JST)
         if now.month == 1:
             return (now.year - 1, 12)
         else:
             return (now.year, now.month - 1)
 
     # 今月
-    if period_lower in ("this", "今月", "0"):
+    if keyword == "this":
+        now = datetime.now(JST)
         return (now.year, now.month)
 
     # N ヶ月前（-2, -3, ...）
-    match = re.match(r'^-(\d+)$', period_lower)
+    match = _MONTHS_AGO_RE.match(period_lower)
     if match:
         months_ago = int(match.group(1))
-        year = now.year
-        month = now.month - months_ago
-        while month <= 0:
-            month += 12
-            year -= 1
-        return (year, month)
+        now = datetime.now(JST)
+        # 月を通し番号にして一度の divmod で戻す（1年より前になる指定は無効）
+        year, month0 = divmod(now.year * 12 + now.month - 1 - months_ago, 12)
+        if year < 1:
+            return None
+        return (year, month0 + 1)
 
     # YYYY-MM 形式
-    match = re.match(r'^(\d{4})-(\d{2})$', period)
+    match = _YM_RE.match(period_lower)
     if match:
         return (int(match.group(1)), int(match.group(2)))
 
@@ -455,20 +554,16 @@ async def lunch_report_command(interaction: discord.Interaction, period: str):
             return
 
         # チャンネルメンバー数（Bot除外）= 分母
-        channel_members = [m for m in lunch_channel.members if not m.bot]
-        total_members = len(channel_members)
+        total_members = count_channel_members(lunch_channel)
 
         # CSV生成
-        csv_content = generate_lunch_csv(stats, total_members)
+        csv_file = generate_lunch_csv(stats, total_members)
 
         # ファイル送信
-        file = discord.File(
-            io.BytesIO(csv_content.encode('utf-8-sig')),
-            filename=filename
-        )
+        file = discord.File(csv_file, filename=filename)
 
         # サマリーメッセージ
-        unique_count = len(stats["unique_participants"])
+        unique_count = len(stats["user_counts"])
         usage_rate = (unique_count / total_members * 100) if total_members > 0 else 0
         summary = (
             f"**ランチ制度 利用状況レポート {period_label}**\n\n"
@@ -492,6 +587,8 @@ async def lunch_report_command(interaction: discord.Interaction, period: str):
             )
 
     except Exception as e:
+        # 想定外の不具合も原因を追えるよう、利用者への通知に加えてトレースバックを残す
+        traceback.print_exc()
         await interaction.followup.send(
             f"エラーが発生しました: {e}",
             ephemeral=True
@@ -501,14 +598,49 @@ async def lunch_report_command(interaction: discord.Interaction, period: str):
 # =============================================================================
 # イベントハンドラ
 # =============================================================================
+def command_tree_digest(guild: discord.abc.Snowflake) -> str:
+    """同期対象のコマンド定義（送信される内容）から作るハッシュ"""
+    payload = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)),
+        key=lambda d: (d.get("type", 1), d["name"])
+    )
+    return hashlib.sha256(
+        json.dumps([GUILD_ID, payload], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+async def sync_commands_if_changed(guild: discord.abc.Snowflake) -> bool:
+    """
+    前回同期したときとコマンド定義が変わっていれば同期する（再接続のたびに同期しない）。
+    同期したら True を返す。
+    """
+    digest = command_tree_digest(guild)
+    if os.environ.get("FORCE_SYNC") != "1":
+        try:
+            with open(COMMAND_SYNC_HASH_PATH, encoding="utf-8") as f:
+                if f.read().strip() == digest:
+                    return False
+        except OSError:
+            pass
+    await tree.sync(guild=guild)
+    try:
+        with open(COMMAND_SYNC_HASH_PATH, "w", encoding="utf-8") as f:
+            f.write(digest)
+    except OSError as e:
+        print(f"Failed to save command sync hash: {e}")
+    return True
+
+
 @client.event
 async def on_ready():
     """Bot起動時の処理"""
     print(f"Logged in as {client.user}")
 
-    # スラッシュコマンド同期
-    await tree.sync(guild=discord.Object(id=GUILD_ID))
-    print("Slash commands synced.")
+    # スラッシュコマンド同期（定義が前回と同じなら省略）
+    if await sync_commands_if_changed(discord.Object(id=GUILD_ID)):
+        print("Slash commands synced.")
+    else:
+        print("Slash commands unchanged; skipped sync.")
 
 
 # =============================================================================
@@ -0,0 +1,55 @@
+"""定型クエリの高速判定 parse_intent_fast のテスト（python -m unittest discover tests）"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+TODAY = "2026-10-15"
+
+
+def period_of(query: str, current_date: str = TODAY):
+    intent = bot.parse_intent_fast(query, current_date, [])
+    return "AI" if intent is None else intent["period"]
+
+
+class ParseIntentFastTest(unittest.TestCase):
+    def test_fixed_queries(self):
+        self.assertEqual(period_of("先月のレポート"), "last")
+        self.assertEqual(period_of("all"), "all")
+        self.assertEqual(period_of("今月の集計"), None)
+        self.assertEqual(period_of("2024-01 の集計"), {"year": 2024, "month": 1})
+        self.assertEqual(period_of("2024年 1月のレポート"), {"year": 2024, "month": 1})
+        self.assertEqual(period_of("3月のレポート"), {"year": 2026, "month": 3})
+
+    def test_future_bare_month_means_previous_year(self):
+        self.assertEqual(period_of("12月のレポート", "2026-01-10"), {"year": 2025, "month": 12})
+
+    def test_ai_prompt_uses_same_year_rule(self):
+        # 年なしの月は、定型クエリ判定とAIへの指示で同じ年に解決する
+        self.assertEqual(period_of("12月のレポート", "2026-01-10"), {"year": 2025, "month": 12})
+        self.assertIn("現在日付が2026-01-10なら「12月」は {\"year\": 2025, \"month\": 12}", bot.INTENT_SYSTEM_PROMPT)
+
+    def test_member_name_goes_to_ai(self):
+        members = [{"id": 1, "name": "【営業】田中 太郎（たろう）"}]
+        intent = bot.parse_intent_fast("田中太郎 のレポート", TODAY, members)
+        self.assertIsNone(intent)
+        self.assertIsNotNone(bot.parse_intent_fast("先月のレポート", TODAY, members))
+
+    def test_ambiguous_queries_go_to_ai(self):
+        for query in (
+            "去年の12月のレポート",
+            "前年の3月のレポート",
+            "2024年度のレポート",
+            "2024-1-5 の集計",
+            "2024年1月と2月の集計",
+            "13月のレポート",
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(period_of(query), "AI")
+
+
+if __name__ == "__main__":
+    unittest.main()
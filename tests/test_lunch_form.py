@@ -0,0 +1,66 @@
+"""ランチ制度フォームパーサーのテスト（python -m unittest discover tests）"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+import lunch_stats  # noqa: E402
+
+FORM = (
+    "新しいランチ制度の申請がありました\n"
+    "【代表者名】\n"
+    "【営業】田中 太郎\n"
+    "【代表者の所属部署】\n"
+    "営業\n"
+    "【ランチ実施日】\n"
+    "2024-01-15\n"
+    "【参加人数】\n"
+    "3人\n"
+    "【参加メンバー】\n"
+    "【営業】田中 太郎\n"
+    "【開発/CTO室】鈴木 花子（はな）\n"
+    "佐藤 次郎\n"
+    "【合計金額（税込）】\n"
+    "4500\n"
+    "【ランチ会議の感想をひとこと】\n"
+    "【良かった】また行きたい"
+)
+
+
+class ParseLunchFormTest(unittest.TestCase):
+    def assert_parsed(self, parse):
+        result = parse(FORM)
+        self.assertIsNotNone(result)
+        self.assertEqual(result["representative"], "【営業】田中 太郎")
+        self.assertEqual(result["department"], "営業")
+        self.assertEqual(result["date"], "2024-01-15")
+        self.assertEqual(result["participant_count"], 3)
+        self.assertEqual(
+            result["participants"],
+            ["【営業】田中 太郎", "【開発/CTO室】鈴木 花子（はな）", "佐藤 次郎"],
+        )
+        self.assertEqual(result["total_amount"], 4500)
+        self.assertEqual(result["comment"], "【良かった】また行きたい")
+
+    def test_bracket_prefixed_values_bot(self):
+        self.assert_parsed(bot.parse_lunch_form)
+
+    def test_bracket_prefixed_values_lunch_stats(self):
+        self.assert_parsed(lunch_stats.parse_lunch_form)
+
+    def test_empty_field_does_not_take_next_header(self):
+        content = FORM.replace("【代表者の所属部署】\n営業\n", "【代表者の所属部署】\n")
+        for parse in (bot.parse_lunch_form, lunch_stats.parse_lunch_form):
+            result = parse(content)
+            self.assertEqual(result["department"], "")
+            self.assertEqual(result["date"], "2024-01-15")
+
+    def test_not_a_form(self):
+        for parse in (bot.parse_lunch_form, lunch_stats.parse_lunch_form):
+            self.assertIsNone(parse("【営業】田中 太郎\nお疲れさまです"))
+
+
+if __name__ == "__main__":
+    unittest.main()